@@ -12,6 +12,83 @@ class Settings(BaseSettings):
     jwt_algorithm: str = os.getenv("JWT_ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")
+    max_node_concurrency: int = int(os.getenv("MAX_NODE_CONCURRENCY", "8"))
+    max_process_node_concurrency: int = int(os.getenv("MAX_PROCESS_NODE_CONCURRENCY", "64"))
+    node_timeout: float = float(os.getenv("NODE_TIMEOUT", "300"))
+    execution_timeout: float = float(os.getenv("EXECUTION_TIMEOUT", "3600"))
+    plan_cache_size: int = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+    recorder_batch_size: int = int(os.getenv("RECORDER_BATCH_SIZE", "25"))
+    recorder_flush_interval: float = float(os.getenv("RECORDER_FLUSH_INTERVAL", "1.0"))
+    batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "16"))
+    batch_insert_size: int = int(os.getenv("BATCH_INSERT_SIZE", "100"))
+    execution_processes: int = int(os.getenv("EXECUTION_PROCESSES", "0"))
+    worker_health_interval: float = float(os.getenv("WORKER_HEALTH_INTERVAL", "2.0"))
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    job_lease_seconds: float = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    job_poll_interval: float = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    node_cache_types: str = os.getenv("NODE_CACHE_TYPES", "")
+    node_cache_size: int = int(os.getenv("NODE_CACHE_SIZE", "10000"))
+    node_cache_max_bytes: int = int(os.getenv("NODE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    node_cache_max_entry_bytes: int = int(os.getenv("NODE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+    node_cache_ttl: float = float(os.getenv("NODE_CACHE_TTL", "3600"))
+    node_cache_backend: str = os.getenv("NODE_CACHE_BACKEND", "memory")
+    node_cache_sqlite_path: str = os.getenv("NODE_CACHE_SQLITE_PATH", "node_cache.sqlite3")
+    event_buffer_size: int = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+    event_token_buffer_size: int = int(os.getenv("EVENT_TOKEN_BUFFER_SIZE", "2000"))
+    event_subscriber_queue_size: int = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "256"))
+    event_retention_seconds: float = float(os.getenv("EVENT_RETENTION_SECONDS", "300"))
+    websocket_send_queue_size: int = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "256"))
+    llm_client_pool_size: int = int(os.getenv("LLM_CLIENT_POOL_SIZE", "256"))
+    ai_graph_cache_size: int = int(os.getenv("AI_GRAPH_CACHE_SIZE", "256"))
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    llm_cache_max_temperature: float = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))
+    llm_cache_size: int = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+    llm_cache_ttl: float = float(os.getenv("LLM_CACHE_TTL", "86400"))
+    llm_cache_backend: str = os.getenv("LLM_CACHE_BACKEND", "sqlite")
+    llm_cache_sqlite_path: str = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.sqlite3")
+    llm_cache_max_entries: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+    llm_requests_per_minute: float = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "3500"))
+    llm_tokens_per_minute: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "90000"))
+    llm_model_rate_limits: str = os.getenv("LLM_MODEL_RATE_LIMITS", "")
+    llm_completion_tokens_estimate: int = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "256"))
+    llm_initial_concurrency: int = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    llm_hedge_percentile: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+    llm_hedge_budget: float = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+    prompt_token_budget: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+    prompt_overflow: str = os.getenv("PROMPT_OVERFLOW", "truncate")
+    prompt_summary_input_tokens: int = int(os.getenv("PROMPT_SUMMARY_INPUT_TOKENS", "8000"))
+    llm_model_prices: str = os.getenv("LLM_MODEL_PRICES", "")
+    llm_provider: str = os.getenv("LLM_PROVIDER", "openai")
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    llm_max_keepalive_connections: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    fake_llm_seed: int = int(os.getenv("FAKE_LLM_SEED", "0"))
+    fake_llm_latency_ms: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+    fake_llm_latency_sigma: float = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+    fake_llm_token_ms: float = float(os.getenv("FAKE_LLM_TOKEN_MS", "10"))
+    fake_llm_response_tokens: int = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "50"))
+    fake_llm_rate_limit_rate: float = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+    fake_llm_retry_after: float = float(os.getenv("FAKE_LLM_RETRY_AFTER", "1.0"))
+    fake_llm_timeout_rate: float = float(os.getenv("FAKE_LLM_TIMEOUT_RATE", "0"))
+    fake_llm_timeout_seconds: float = float(os.getenv("FAKE_LLM_TIMEOUT_SECONDS", "30"))
+    custom_code_enabled: bool = os.getenv("CUSTOM_CODE_ENABLED", "false").lower() == "true"
+    sandbox_user: str = os.getenv("SANDBOX_USER", "nobody")
+    sandbox_workers: int = int(os.getenv("SANDBOX_WORKERS", "2"))
+    sandbox_cpu_seconds: float = float(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+    sandbox_memory_mb: int = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+    sandbox_timeout: float = float(os.getenv("SANDBOX_TIMEOUT", "30"))
+    sandbox_module_cache_size: int = int(os.getenv("SANDBOX_MODULE_CACHE_SIZE", "128"))
+    sandbox_max_calls: int = int(os.getenv("SANDBOX_MAX_CALLS", "1000"))
+    sandbox_environment_pools: int = int(os.getenv("SANDBOX_ENVIRONMENT_POOLS", "4"))
+    environment_max_count: int = int(os.getenv("ENVIRONMENT_MAX_COUNT", "50"))
+    environments_dir: str = os.getenv("ENVIRONMENTS_DIR", "environments")
+    pip_wheelhouse: str = os.getenv("PIP_WHEELHOUSE", "")
+    pip_index_url: str = os.getenv("PIP_INDEX_URL", "")
+    environment_build_timeout: float = float(os.getenv("ENVIRONMENT_BUILD_TIMEOUT", "600"))
+    transform_engine: str = os.getenv("TRANSFORM_ENGINE", "auto")
+    transform_batch_size: int = int(os.getenv("TRANSFORM_BATCH_SIZE", "50000"))
     
     class Config:
         env_file = ".env"
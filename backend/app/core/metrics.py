@@ -0,0 +1,39 @@
+from collections import defaultdict
+from typing import Dict, Any
+import threading
+
+class Metrics:
+    """Minimal in-process counters and summaries exposed on /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.summaries: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Record an observation of a summary such as a latency or a batch size"""
+        with self._lock:
+            summary = self.summaries.get(name)
+            if summary is None:
+                self.summaries[name] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+                return
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            summary["last"] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get a copy of all counters and summaries"""
+        with self._lock:
+            summaries = {}
+            for name, summary in self.summaries.items():
+                summaries[name] = {**summary, "avg": summary["sum"] / summary["count"]}
+            return {"counters": dict(self.counters), "summaries": summaries}
+
+metrics = Metrics()
@@ -48,6 +48,13 @@ async def create_indexes():
         await db.database.executions.create_index("user_id")
         await db.database.executions.create_index("created_at")
         
+        # Execution job queue indexes
+        await db.database.execution_jobs.create_index([("status", 1), ("created_at", 1)])
+        await db.database.execution_jobs.create_index("lease_expires_at")
+        
+        # Node result cache entries expire through a TTL index
+        await db.database.node_result_cache.create_index("expires_at", expireAfterSeconds=0)
+        
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.error(f"Failed to create indexes: {e}")
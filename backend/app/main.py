@@ -6,6 +6,10 @@ import uvicorn
 from app.database import connect_to_mongo, close_mongo_connection
 from app.routers import auth, workflows, nodes, execution
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.llm_providers import close_provider
+from app.services.sandbox import environment_pools, sandbox_pool
+from app.services.worker_pool import worker_pool
 
 security = HTTPBearer()
 
@@ -13,8 +17,16 @@ security = HTTPBearer()
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    if settings.execution_processes > 0:
+        await worker_pool.start(settings.execution_processes)
     yield
     # Shutdown
+    if worker_pool.running:
+        await worker_pool.stop()
+    if sandbox_pool.running:
+        sandbox_pool.stop()
+    environment_pools.stop()
+    await close_provider()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -47,6 +59,14 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/workers")
+async def worker_health():
+    return worker_pool.health()
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
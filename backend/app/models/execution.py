@@ -8,19 +8,34 @@ class ExecutionStep(BaseModel):
     node_id: str
     node_type: str
     status: str  # pending, running, completed, failed
+    # Steps store only their own output; inputs are rebuilt from the parents
+    parent_node_ids: Optional[List[str]] = None
+    position: Optional[int] = None
     input_data: Dict[str, Any] = {}
     output_data: Dict[str, Any] = {}
     error_message: Optional[str] = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    cache_hit: bool = False
+    saved_ms: Optional[float] = None  # original run time of a result served from cache
+    prompt_tokens: Optional[int] = None
+    prompt_truncated: bool = False
+    # LLM calls of the node: models, calls, prompt/completion/total tokens, latency_ms, cost (USD)
+    llm_usage: Optional[Dict[str, Any]] = None
+    carried_over: bool = False  # copied from the execution this one was resumed from
+    fingerprint: Optional[str] = None  # config of the node and everything upstream of it
 
 class ExecutionBase(BaseModel):
     workflow_id: str
-    status: str = "pending"  # pending, running, completed, failed
+    status: str = "pending"  # pending, queued, running, completed, failed, cancelled
     steps: List[ExecutionStep] = []
     input_data: Dict[str, Any] = {}
     output_data: Dict[str, Any] = {}
     error_message: Optional[str] = None
+    resumed_from: Optional[str] = None  # execution this one was resumed from
+    root_execution_id: Optional[str] = None  # first execution of the resume chain
+    revision: Optional[List[Any]] = None  # revision of the workflow that ran
+    llm_usage: Optional[Dict[str, Any]] = None  # LLM usage of all steps
 
 class ExecutionCreate(ExecutionBase):
     pass
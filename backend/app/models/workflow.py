@@ -29,6 +29,7 @@ class WorkflowBase(BaseModel):
     edges: List[WorkflowEdge] = []
     is_public: bool = False
     status: str = "draft"  # draft, published, archived
+    settings: Dict[str, Any] = {}  # execution settings, e.g. timeout in seconds
 
 class WorkflowCreate(WorkflowBase):
     pass
@@ -40,6 +41,7 @@ class WorkflowUpdate(BaseModel):
     edges: Optional[List[WorkflowEdge]] = None
     is_public: Optional[bool] = None
     status: Optional[str] = None
+    settings: Optional[Dict[str, Any]] = None
 
 class WorkflowInDB(WorkflowBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from datetime import timedelta
+from typing import Optional
 from app.models.user import UserCreate, User, Token, UserInDB
 from app.core.security import verify_password, get_password_hash, create_access_token, verify_token
 from app.database import get_database
@@ -33,6 +34,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return UserInDB(**user)
 
+async def get_token_user(token: Optional[str]) -> Optional[UserInDB]:
+    """Get the user of an access token, None if the token or user is invalid"""
+    email = verify_token(token) if token else None
+    if email is None:
+        return None
+    
+    user = await get_database().users.find_one({"email": email})
+    return UserInDB(**user) if user else None
+
 @router.post("/register", response_model=Token)
 async def register(user_data: UserCreate):
     db = get_database()
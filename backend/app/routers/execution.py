@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, AsyncIterator, Optional
 from app.models.user import UserInDB
 from app.models.execution import ExecutionCreate, Execution
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, get_token_user
 from app.services.execution_service import ExecutionService
+from app.services.execution_stream import ExecutionStreamSession
+from app.services.execution_context import rebuild_step_inputs
 from app.database import get_database
 import logging
 import json
@@ -15,11 +18,16 @@ router = APIRouter()
 async def execute_workflow(
     workflow_id: str,
     input_data: Dict[str, Any] = {},
+    queued: bool = False,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Execute a workflow"""
+    """Execute a workflow, or queue it for a worker when queued is set"""
     try:
         execution_service = ExecutionService()
+        if queued:
+            return await execution_service.enqueue_workflow(
+                workflow_id, str(current_user.id), input_data
+            )
         result = await execution_service.execute_workflow(
             workflow_id, str(current_user.id), input_data
         )
@@ -28,6 +36,81 @@ async def execute_workflow(
         logger.error(f"Failed to execute workflow: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def read_batch_inputs(request: Request) -> AsyncIterator[Any]:
+    """Read batch inputs from a JSON array or an NDJSON request body"""
+    if "ndjson" not in request.headers.get("content-type", ""):
+        body = await request.json()
+        if not isinstance(body, list):
+            raise ValueError("Batch body must be a JSON array")
+        for item in body:
+            yield item
+        return
+    
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    
+    if buffer.strip():
+        yield json.loads(buffer)
+
+@router.post("/batch/{workflow_id}")
+async def execute_batch(
+    workflow_id: str,
+    request: Request,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Execute a workflow once per input, streaming results back as NDJSON"""
+    try:
+        execution_service = ExecutionService()
+        results = await execution_service.execute_batch(
+            workflow_id, str(current_user.id), read_batch_inputs(request)
+        )
+    except Exception as e:
+        logger.error(f"Failed to start batch execution: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def stream_results():
+        async for result in results:
+            yield json.dumps(result, default=str) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.post("/resume/{execution_id}")
+async def resume_execution(
+    execution_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Resume a failed execution from its last completed step"""
+    try:
+        execution_service = ExecutionService()
+        result = await execution_service.resume_execution(
+            execution_id, str(current_user.id)
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Failed to resume execution: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/cancel/{execution_id}")
+async def cancel_execution(
+    execution_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Cancel a queued or running execution"""
+    try:
+        execution_service = ExecutionService()
+        result = await execution_service.cancel_execution(
+            execution_id, str(current_user.id)
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Failed to cancel execution: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/history/{workflow_id}")
 async def get_execution_history(
     workflow_id: str,
@@ -45,30 +128,46 @@ async def get_execution_history(
         Execution(
             id=str(execution["_id"]),
             user_id=str(execution["user_id"]),
-            **{k: v for k, v in execution.items() if k not in ["_id", "user_id"]}
+            steps=rebuild_step_inputs(execution),
+            **{k: v for k, v in execution.items() if k not in ["_id", "user_id", "steps"]}
         )
         for execution in executions
     ]
 
+@router.get("/usage")
+async def get_usage_summary(
+    days: float = 7,
+    limit: int = 10,
+    sort_by: str = "tokens",
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Get the workflows and nodes that used the most LLM tokens or time"""
+    try:
+        execution_service = ExecutionService()
+        return await execution_service.get_usage_summary(str(current_user.id), days, limit, sort_by)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.websocket("/ws/{workflow_id}")
-async def websocket_execution(websocket: WebSocket, workflow_id: str):
-    """WebSocket endpoint for real-time execution updates"""
+async def websocket_execution(websocket: WebSocket, workflow_id: str, token: Optional[str] = None):
+    """WebSocket endpoint for real-time updates of many executions at once"""
+    # Browsers cannot set headers on WebSockets, so the token may also be a query parameter
+    authorization = websocket.headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    
+    user = await get_token_user(token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
     await websocket.accept()
     
     try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            if message["type"] == "execute":
-                execution_service = ExecutionService()
-                async for update in execution_service.execute_workflow_stream(
-                    workflow_id, message.get("user_id"), message.get("input_data", {})
-                ):
-                    await websocket.send_text(json.dumps(update))
-                    
+        await ExecutionStreamSession(websocket, workflow_id, str(user.id)).run()
+        
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for workflow {workflow_id}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        await websocket.close()
\ No newline at end of file
+        await websocket.close()
@@ -4,6 +4,7 @@ from app.models.workflow import WorkflowCreate, WorkflowUpdate, Workflow, Workfl
 from app.models.user import UserInDB
 from app.routers.auth import get_current_user
 from app.database import get_database
+from app.services.execution_plan import plan_cache
 from bson import ObjectId
 from datetime import datetime
 import logging
@@ -86,12 +87,14 @@ async def update_workflow(
     
     result = await db.workflows.update_one(
         {"_id": ObjectId(workflow_id), "user_id": current_user.id},
-        {"$set": update_data}
+        {"$set": update_data, "$inc": {"revision": 1}}
     )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
+    plan_cache.invalidate(workflow_id)
+    
     updated_workflow = await db.workflows.find_one({"_id": ObjectId(workflow_id)})
     
     return Workflow(
@@ -118,4 +121,6 @@ async def delete_workflow(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
+    plan_cache.invalidate(workflow_id)
+    
     return {"message": "Workflow deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,222 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.single_flight import SingleFlight
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Plain PEP 508 requirements: a name, extras and version specifiers. Options,
+# URLs, paths and markers are rejected, since they would let a custom node
+# pull code from outside the configured wheelhouse or mirror.
+_VERSION = r"(?:===|~=|==|!=|<=|>=|<|>)[A-Za-z0-9.*+!_-]+"
+_REQUIREMENT = re.compile(
+    r"^([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)"
+    r"(\[[A-Za-z0-9._-]+(?:,[A-Za-z0-9._-]+)*\])?"
+    rf"({_VERSION}(?:,{_VERSION})*)?$"
+)
+
+class EnvironmentBuildError(Exception):
+    """A requirements environment that could not be built"""
+
+def normalize_requirements(requirements: Iterable[str]) -> List[str]:
+    """Validate requirements and put them in canonical form, so equal sets hash the same"""
+    normalized = set()
+    for requirement in requirements:
+        requirement = re.sub(r"\s+", "", str(requirement))
+        if not requirement or requirement.startswith("#"):
+            continue
+        match = _REQUIREMENT.match(requirement)
+        if not match:
+            raise ValueError(f"Invalid requirement: {requirement}")
+        name, extras, versions = match.groups()
+        name = re.sub(r"[-_.]+", "-", name).lower()
+        extras = ",".join(sorted(extras[1:-1].lower().split(","))) if extras else ""
+        versions = ",".join(sorted(versions.split(","))) if versions else ""
+        normalized.add(name + (f"[{extras}]" if extras else "") + versions)
+    return sorted(normalized)
+
+def environment_key(requirements: List[str]) -> str:
+    """Get the content hash of a normalized requirement set"""
+    # Wheels are specific to the interpreter, so its version is part of the key
+    material = "\n".join([f"python{sys.version_info[0]}.{sys.version_info[1]}"] + requirements)
+    return hashlib.sha256(material.encode()).hexdigest()[:24]
+
+class EnvironmentManager:
+    """Build each distinct requirement set once, into a content-addressed directory
+
+    An environment is a ``pip install --target`` directory named after the
+    hash of its requirements, so nodes with the same set share it and it
+    survives restarts. Builds are coalesced within a process and serialized
+    across processes with a lock file, and a build only becomes visible once
+    it is complete, by renaming it into place. Using an environment touches
+    its directory, and beyond ``ENVIRONMENT_MAX_COUNT`` the least recently
+    used ones that no sandbox pool of this process runs in are removed.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.ready: Dict[str, str] = {}
+        self.active: Set[str] = set()
+        self.builds = SingleFlight("environments")
+
+    async def ensure(self, requirements: Iterable[str]) -> Optional[str]:
+        """Get the path of the environment of a requirement set, building it if needed
+
+        Returns None for an empty set, which runs in the default environment.
+        """
+        requirements = normalize_requirements(requirements)
+        if not requirements:
+            return None
+
+        key = environment_key(requirements)
+        path = self.ready.get(key)
+        if path is not None and self._touch(path):
+            metrics.increment("environments.hits")
+            return path
+
+        path = await self.builds.do(key, lambda: self._build(key, requirements))
+        self.ready[key] = path
+        await self._evict(path)
+        return path
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Mark an environment as used, False if it was removed"""
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    async def _build(self, key: str, requirements: List[str]) -> str:
+        path = os.path.join(self.root, key)
+        if self._touch(path):
+            metrics.increment("environments.hits")
+            return path
+
+        if not settings.pip_wheelhouse and not settings.pip_index_url:
+            raise EnvironmentBuildError(
+                f"Cannot install {', '.join(requirements)}: set PIP_WHEELHOUSE or PIP_INDEX_URL "
+                "to install requirements from a wheelhouse or index mirror"
+            )
+
+        os.makedirs(self.root, exist_ok=True)
+        lock = open(path + ".lock", "w")
+        try:
+            await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+            if os.path.isdir(path):
+                # Built by another process while this one waited for the lock
+                metrics.increment("environments.hits")
+                return path
+
+            start = time.perf_counter()
+            building = tempfile.mkdtemp(prefix=f"{key}.", dir=self.root)
+            try:
+                await self._install(building, requirements)
+                with open(os.path.join(building, "requirements.txt"), "w") as f:
+                    f.write("\n".join(requirements) + "\n")
+                os.rename(building, path)
+            except BaseException:
+                shutil.rmtree(building, ignore_errors=True)
+                metrics.increment("environments.build_failures")
+                raise
+
+            metrics.increment("environments.builds")
+            metrics.observe("environments.build_ms", (time.perf_counter() - start) * 1000)
+            logger.info(f"Built environment {key} for {', '.join(requirements)}")
+            return path
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    async def _evict(self, keep: str):
+        """Remove the least recently used environments beyond ENVIRONMENT_MAX_COUNT"""
+        if settings.environment_max_count <= 0:
+            return
+
+        environments = await asyncio.to_thread(self._list)
+        excess = len(environments) - settings.environment_max_count
+        for path in environments[:max(0, excess)]:
+            if path == keep or path in self.active:
+                continue
+            if await asyncio.to_thread(self._remove, path):
+                self.ready = {key: ready for key, ready in self.ready.items() if ready != path}
+                metrics.increment("environments.evictions")
+                logger.info(f"Removed environment {os.path.basename(path)}")
+
+    def _list(self) -> List[str]:
+        """Get the paths of the built environments, least recently used first"""
+        paths = [
+            os.path.join(self.root, name)
+            for name in os.listdir(self.root)
+            if re.fullmatch(r"[0-9a-f]{24}", name)
+        ]
+        return sorted((path for path in paths if os.path.isdir(path)), key=os.path.getmtime)
+
+    def _remove(self, path: str) -> bool:
+        with open(path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Being rebuilt by another process
+                return False
+            try:
+                # Renamed away first, so no process sees a partly removed environment
+                trash = tempfile.mkdtemp(prefix=".removing.", dir=self.root)
+                os.rename(path, os.path.join(trash, "environment"))
+                shutil.rmtree(trash, ignore_errors=True)
+                return True
+            except OSError:
+                return False
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    async def _install(target: str, requirements: List[str]):
+        """Install requirements into a directory with pip"""
+        args = [
+            sys.executable, "-m", "pip", "install",
+            "--target", target,
+            # Ignore pip's config files and environment, which could add other indexes
+            "--isolated",
+            "--only-binary", ":all:",
+            "--no-input",
+            "--disable-pip-version-check",
+            "--no-warn-script-location"
+        ]
+        if settings.pip_wheelhouse:
+            args += ["--no-index", "--find-links", settings.pip_wheelhouse]
+        else:
+            args += ["--index-url", settings.pip_index_url]
+
+        process = await asyncio.create_subprocess_exec(
+            *args, *requirements,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), settings.environment_build_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise EnvironmentBuildError(f"Installing {', '.join(requirements)} timed out")
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+
+        if process.returncode != 0:
+            # The end of pip's output says which requirement failed and why
+            message = output.decode(errors="replace").strip().splitlines()[-5:]
+            raise EnvironmentBuildError(f"Installing {', '.join(requirements)} failed: {' '.join(message)}")
+
+environment_manager = EnvironmentManager(settings.environments_dir)
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+from collections import deque
+from typing import Dict, Any, AsyncGenerator, Iterator, Optional, Set
+from app.core.config import settings
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Subscriber:
+    __slots__ = ("queue", "lagged")
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.event_subscriber_queue_size)
+        self.lagged = False
+
+# Partial node output, published far more often than any other event
+TOKEN_EVENTS = frozenset({"node_token"})
+
+class ExecutionChannel:
+    """Events of one execution, kept in bounded ring buffers for replay
+
+    Token events have a ring buffer of their own, so a node streaming a long
+    output cannot push node and execution events out of the replay buffer.
+    """
+
+    def __init__(self):
+        self.events: deque = deque(maxlen=settings.event_buffer_size)
+        self.tokens: deque = deque(maxlen=settings.event_token_buffer_size)
+        self.last_event_id = 0
+        # Id of the newest event pushed out of either buffer
+        self.last_dropped_id = 0
+        self.subscribers: Set[_Subscriber] = set()
+        self.closed = False
+
+    def append(self, event: Dict[str, Any]):
+        buffer = self.tokens if event.get("type") in TOKEN_EVENTS else self.events
+        if len(buffer) == buffer.maxlen:
+            dropped = buffer[0] if buffer else event
+            self.last_dropped_id = max(self.last_dropped_id, dropped["event_id"])
+        buffer.append(event)
+
+    def replay(self, after_event_id: int) -> Iterator[Dict[str, Any]]:
+        """Iterate buffered events newer than the given event id"""
+        for event in heapq.merge(list(self.events), list(self.tokens), key=lambda event: event["event_id"]):
+            if event["event_id"] > after_event_id:
+                yield event
+
+class EventBus:
+    """In-process pub/sub of execution events
+
+    An execution publishes each event once; every subscriber gets it from
+    its own bounded queue. Subscribers that fall behind are not waited for:
+    once their queue is full they are marked as lagged and catch up from
+    the ring buffer instead, so a slow client never stalls the execution.
+    Subscribing with a last-seen event id resumes a dropped stream.
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, ExecutionChannel] = {}
+
+    def open(self, execution_id: str) -> ExecutionChannel:
+        """Create the channel of a new execution"""
+        channel = ExecutionChannel()
+        self.channels[execution_id] = channel
+        return channel
+
+    def publish(self, execution_id: str, event: Dict[str, Any]) -> Optional[int]:
+        """Publish an event and return its id"""
+        channel = self.channels.get(execution_id)
+        if channel is None or channel.closed:
+            return None
+
+        channel.last_event_id += 1
+        event = {**event, "execution_id": execution_id, "event_id": channel.last_event_id}
+        channel.append(event)
+
+        for subscriber in channel.subscribers:
+            self._offer(subscriber, event)
+
+        return channel.last_event_id
+
+    def close(self, execution_id: str):
+        """Mark an execution as finished; its events stay replayable for a while"""
+        channel = self.channels.get(execution_id)
+        if channel is None or channel.closed:
+            return
+
+        channel.closed = True
+        for subscriber in channel.subscribers:
+            self._offer(subscriber, None)
+
+        asyncio.get_running_loop().call_later(
+            settings.event_retention_seconds, self._discard, execution_id, channel
+        )
+
+    def _discard(self, execution_id: str, channel: ExecutionChannel):
+        if self.channels.get(execution_id) is channel:
+            del self.channels[execution_id]
+
+    @staticmethod
+    def _offer(subscriber: _Subscriber, event: Optional[Dict[str, Any]]):
+        if subscriber.lagged:
+            return
+        try:
+            subscriber.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            subscriber.lagged = True
+            metrics.increment("event_bus.lagged_subscribers")
+
+    def has_channel(self, execution_id: str) -> bool:
+        """Check whether events of an execution can still be subscribed to"""
+        return execution_id in self.channels
+
+    async def subscribe(
+        self, execution_id: str, last_event_id: int = 0
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield events of an execution newer than last_event_id until it finishes"""
+        channel = self.channels.get(execution_id)
+        if channel is None:
+            return
+
+        subscriber = _Subscriber()
+        channel.subscribers.add(subscriber)
+        last = last_event_id
+        catch_up = True
+
+        try:
+            while True:
+                if catch_up or subscriber.lagged:
+                    # Live events queued so far are also in the ring buffer
+                    subscriber.lagged = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+
+                    # Some events in the range may still be buffered and follow
+                    if last < channel.last_dropped_id:
+                        yield {
+                            "type": "events_lost",
+                            "execution_id": execution_id,
+                            "from_event_id": last + 1,
+                            "to_event_id": channel.last_dropped_id
+                        }
+
+                    for event in channel.replay(last):
+                        yield event
+                        last = event["event_id"]
+
+                    # Events published while replaying are picked up from
+                    # the queue, or by another replay once the channel closed
+                    catch_up = channel.closed
+                    if catch_up and last >= channel.last_event_id:
+                        return
+                    continue
+
+                event = await subscriber.queue.get()
+                if event is None:
+                    catch_up = True
+                    continue
+
+                if event["event_id"] > last:
+                    yield event
+                    last = event["event_id"]
+        finally:
+            channel.subscribers.discard(subscriber)
+
+event_bus = EventBus()
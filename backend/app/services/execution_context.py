@@ -0,0 +1,139 @@
+from collections.abc import Mapping
+from typing import Dict, Any, Iterator, List, Optional, Sequence
+
+class ExecutionContext(Mapping):
+    """Immutable, layered view of the data flowing through an execution
+
+    Every layer holds only the output (delta) of one node plus references to
+    the layers it was built on, so passing context downstream never copies
+    upstream data. A key resolves to the value set by the highest-ranked
+    (latest in topological order) reachable layer, which is the same result
+    as merging the workflow input and all ancestor outputs in order.
+    """
+
+    __slots__ = ("delta", "parents", "rank", "_flat")
+
+    def __init__(
+        self,
+        delta: Optional[Dict[str, Any]] = None,
+        parents: Sequence["ExecutionContext"] = (),
+        rank: float = -1
+    ):
+        self.delta = delta or {}
+        self.parents = tuple(parents)
+        self.rank = rank
+        self._flat: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def merge(cls, parents: Sequence["ExecutionContext"]) -> "ExecutionContext":
+        """Get a read-only view over several layers"""
+        if len(parents) == 1:
+            return parents[0]
+        return cls(None, parents, max(parent.rank for parent in parents))
+
+    def push(self, delta: Dict[str, Any], rank: float) -> "ExecutionContext":
+        """Get a new layer holding a node's output on top of this context"""
+        # Views carry no data of their own, so link straight to their parents
+        parents = self.parents if not self.delta and self.parents else (self,)
+        return ExecutionContext(delta, parents, rank)
+
+    def _layers(self) -> List["ExecutionContext"]:
+        """Get all reachable layers with data, ordered by rank"""
+        seen = set()
+        layers = []
+        stack = [self]
+        while stack:
+            layer = stack.pop()
+            if id(layer) in seen:
+                continue
+            seen.add(id(layer))
+            if layer.delta:
+                layers.append(layer)
+            stack.extend(layer.parents)
+        layers.sort(key=lambda layer: layer.rank)
+        return layers
+
+    def _find(self, key: str):
+        best_rank = None
+        best_value = _MISSING
+        seen = set()
+        stack = [self]
+        while stack:
+            layer = stack.pop()
+            if id(layer) in seen:
+                continue
+            seen.add(id(layer))
+
+            # Parents always rank below their children, so nothing further
+            # up this branch can beat a value that was already found
+            if best_rank is not None and layer.rank <= best_rank:
+                continue
+
+            if key in layer.delta:
+                best_rank = layer.rank
+                best_value = layer.delta[key]
+                continue
+
+            stack.extend(layer.parents)
+
+        return best_value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a flattened copy of the context"""
+        if self._flat is None:
+            flat = {}
+            for layer in self._layers():
+                flat.update(layer.delta)
+            self._flat = flat
+        return dict(self._flat)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._find(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self._find(key) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        if self._flat is None:
+            self.to_dict()
+        return iter(self._flat)
+
+    def __len__(self) -> int:
+        if self._flat is None:
+            self.to_dict()
+        return len(self._flat)
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+_MISSING = object()
+
+def rebuild_step_inputs(execution: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Rebuild the full input snapshot of every step of an execution record
+
+    Steps store only their node's output, the ids of their parent nodes and
+    the node's topological position, which is used as the layer rank.
+    Steps are recorded in completion order and a node only starts once all
+    of its parents have completed, so parents are always seen first.
+    """
+    root = ExecutionContext(execution.get("input_data", {}))
+    layers: Dict[str, ExecutionContext] = {}
+    steps = []
+
+    for rank, step in enumerate(execution.get("steps", [])):
+        parent_ids = step.get("parent_node_ids")
+        if parent_ids is None:
+            # Records written before layered contexts carry a full snapshot
+            steps.append(step)
+            continue
+
+        parents = [layers[parent_id] for parent_id in parent_ids if parent_id in layers]
+        context = ExecutionContext.merge(parents) if parents else root
+        position = step.get("position")
+        layers[step["node_id"]] = context.push(step.get("output_data") or {}, rank if position is None else position)
+        steps.append({**step, "input_data": context.to_dict()})
+
+    return steps
@@ -0,0 +1,151 @@
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from app.core.config import settings
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CompiledNode:
+    """A workflow node with its handler resolved and its edges as plan indices"""
+
+    __slots__ = ("index", "id", "type", "config", "handler", "timeout", "parents", "children", "fingerprint")
+
+    def __init__(self, index: int, node: Dict[str, Any], handler: Callable):
+        self.index = index
+        self.id = node["id"]
+        self.type = node["data"]["type"]
+        self.config = node["data"].get("config", {})
+        self.handler = handler
+        self.timeout = float(self.config.get("timeout") or settings.node_timeout)
+        self.parents: Tuple[int, ...] = ()
+        self.children: Tuple[int, ...] = ()
+        # Identifies the node's config and that of everything upstream of it
+        self.fingerprint = ""
+
+class ExecutionPlan:
+    """A validated, immutable execution plan for one revision of a workflow
+
+    ``nodes`` is indexed by position in ``order``, so a node's index is also
+    its topological rank and every parent index is smaller than its child's.
+    """
+
+    def __init__(
+        self,
+        workflow_id: str,
+        revision: Any,
+        nodes: List[CompiledNode],
+        workflow_settings: Optional[Dict[str, Any]] = None
+    ):
+        self.workflow_id = workflow_id
+        self.revision = revision
+        self.nodes = nodes
+        self.settings = workflow_settings or {}
+        self.timeout = float(self.settings.get("timeout") or settings.execution_timeout)
+        self.order = [node.id for node in nodes]
+        self.index = {node.id: node.index for node in nodes}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @classmethod
+    def compile(
+        cls,
+        workflow_id: str,
+        revision: Any,
+        nodes: list,
+        edges: list,
+        handlers: Dict[str, Callable],
+        workflow_settings: Optional[Dict[str, Any]] = None
+    ) -> "ExecutionPlan":
+        """Validate a workflow graph and compile it into an execution plan"""
+        node_map = {}
+        for node in nodes:
+            if node["id"] in node_map:
+                raise ValueError(f"Duplicate node id: {node['id']}")
+            node_type = node["data"]["type"]
+            if node_type not in handlers:
+                raise ValueError(f"Unknown node type: {node_type}")
+            node_map[node["id"]] = node
+
+        children = {node_id: [] for node_id in node_map}
+        in_degree = {node_id: 0 for node_id in node_map}
+        for edge in edges:
+            source, target = edge["source"], edge["target"]
+            if source not in node_map or target not in node_map:
+                raise ValueError(f"Edge {edge.get('id', '')} references an unknown node")
+            children[source].append(target)
+            in_degree[target] += 1
+
+        # Kahn's algorithm; a deque keeps this linear on wide graphs
+        queue = deque(node_id for node_id, degree in in_degree.items() if degree == 0)
+        order = []
+        while queue:
+            node_id = queue.popleft()
+            order.append(node_id)
+            for child in children[node_id]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+
+        if len(order) != len(node_map):
+            raise ValueError("Workflow contains a cycle")
+
+        position = {node_id: i for i, node_id in enumerate(order)}
+        compiled = [
+            CompiledNode(i, node_map[node_id], handlers[node_map[node_id]["data"]["type"]])
+            for i, node_id in enumerate(order)
+        ]
+
+        parents = [[] for _ in compiled]
+        for node in compiled:
+            node.children = tuple(sorted(position[child] for child in children[node.id]))
+            for child in node.children:
+                parents[child].append(node.index)
+
+        for node in compiled:
+            node.parents = tuple(sorted(parents[node.index]))
+            # Parents come first in topological order, so their fingerprints are set
+            upstream = sorted((compiled[parent].id, compiled[parent].fingerprint) for parent in node.parents)
+            data = json.dumps([node.type, node.config, upstream], sort_keys=True, default=str)
+            node.fingerprint = hashlib.sha256(data.encode()).hexdigest()[:16]
+
+        return cls(workflow_id, revision, compiled, workflow_settings)
+
+class PlanCache:
+    """In-process LRU cache of compiled plans keyed by workflow id and revision"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.plans: "OrderedDict[str, ExecutionPlan]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow_id: str, revision: Any) -> Optional[ExecutionPlan]:
+        """Get a cached plan if it was compiled from the given revision"""
+        plan = self.plans.get(workflow_id)
+        if plan is None or plan.revision != revision:
+            self.misses += 1
+            return None
+
+        self.plans.move_to_end(workflow_id)
+        self.hits += 1
+        return plan
+
+    def put(self, plan: ExecutionPlan):
+        """Cache a plan, evicting the least recently used ones"""
+        self.plans[plan.workflow_id] = plan
+        self.plans.move_to_end(plan.workflow_id)
+        while len(self.plans) > self.max_size:
+            self.plans.popitem(last=False)
+
+    def invalidate(self, workflow_id: str):
+        """Drop the cached plan of a workflow"""
+        self.plans.pop(workflow_id, None)
+
+plan_cache = PlanCache(settings.plan_cache_size)
+
+def workflow_revision(workflow: Dict[str, Any]) -> Any:
+    """Get the cache key component identifying a workflow revision"""
+    return (workflow.get("revision", 0), workflow.get("updated_at"))
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from bson import ObjectId
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database import get_database
+from app.services.llm_usage import UsageTotals
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExecutionRecorder:
+    """Write-behind buffer for the step records and status of one execution
+
+    Steps and field updates are coalesced into a single ``$push $each`` /
+    ``$set`` update that is flushed once ``batch_size`` steps are buffered
+    or ``flush_interval`` seconds after the first buffered change. With a
+    ``run_id`` only the run that set it on the execution writes to it, so a
+    run that lost its job to another worker cannot overwrite the new one.
+    """
+
+    def __init__(
+        self,
+        execution_id: ObjectId,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        run_id: Optional[ObjectId] = None
+    ):
+        self.execution_id = execution_id
+        self.filter: Dict[str, Any] = {"_id": execution_id}
+        if run_id is not None:
+            self.filter["run_id"] = run_id
+        self.batch_size = batch_size or settings.recorder_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else settings.recorder_flush_interval
+        self.steps: List[Dict[str, Any]] = []
+        self.fields: Dict[str, Any] = {}
+        self.usage = UsageTotals()
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def add_step(self, step: Dict[str, Any]):
+        """Buffer a step record"""
+        self.steps.append(step)
+        self.usage.add(step)
+        if len(self.steps) >= self.batch_size:
+            await self.flush()
+        else:
+            self._schedule_flush()
+
+    def set_fields(self, **fields):
+        """Buffer field updates on the execution document"""
+        self.fields.update(fields)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush execution {self.execution_id}: {e}")
+
+    async def flush(self):
+        """Write all buffered changes in one update"""
+        async with self._lock:
+            if not self.steps and not self.fields:
+                return
+
+            steps, self.steps = self.steps, []
+            fields, self.fields = self.fields, {}
+
+            update = {"$set": {**fields, "updated_at": datetime.utcnow()}}
+            if steps:
+                update["$push"] = {"steps": {"$each": steps}}
+
+            start = time.perf_counter()
+            try:
+                await get_database().executions.update_one(self.filter, update)
+            except BaseException:
+                # Keep the changes so the final flush can retry them
+                self.steps = steps + self.steps
+                self.fields = {**fields, **self.fields}
+                raise
+
+            metrics.observe("execution_recorder.flush_seconds", time.perf_counter() - start)
+            metrics.observe("execution_recorder.batch_size", len(steps))
+            metrics.increment("execution_recorder.flushes")
+
+    async def close(self, **fields):
+        """Buffer the final fields and flush everything that is still pending"""
+        self.fields.update(fields)
+        usage = self.usage.result()
+        if usage is not None:
+            # LLM usage of all steps, rolled up on the execution
+            self.fields["llm_usage"] = usage
+        await self.flush()
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+
+class StepCollector:
+    """Collect step records in memory for executions that are written in one insert"""
+
+    def __init__(self):
+        self.steps: List[Dict[str, Any]] = []
+
+    async def add_step(self, step: Dict[str, Any]):
+        """Collect a step record"""
+        self.steps.append(step)
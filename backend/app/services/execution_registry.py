@@ -0,0 +1,37 @@
+import asyncio
+from typing import Dict, Set
+
+class ExecutionCancelledError(Exception):
+    """Raised when an execution was cancelled on request"""
+
+class ExecutionRegistry:
+    """Tasks of the executions running in this process, keyed by execution id"""
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.cancel_requests: Set[str] = set()
+
+    def register(self, execution_id: str, task: asyncio.Task):
+        """Track the task running an execution"""
+        self.tasks[execution_id] = task
+
+    def unregister(self, execution_id: str):
+        """Stop tracking a finished execution"""
+        self.tasks.pop(execution_id, None)
+        self.cancel_requests.discard(execution_id)
+
+    def cancel(self, execution_id: str) -> bool:
+        """Cancel an execution running in this process; returns False if there is none"""
+        task = self.tasks.get(execution_id)
+        if task is None or task.done():
+            return False
+
+        self.cancel_requests.add(execution_id)
+        task.cancel()
+        return True
+
+    def is_cancel_requested(self, execution_id: str) -> bool:
+        """Check whether an execution was cancelled on request"""
+        return execution_id in self.cancel_requests
+
+execution_registry = ExecutionRegistry()
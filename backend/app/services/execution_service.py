@@ -1,67 +1,345 @@
 import asyncio
-from typing import Dict, Any, AsyncGenerator
+import time
+from typing import Dict, Any, AsyncGenerator, AsyncIterator, Optional, Union
+from app.core.config import settings
 from app.database import get_database
 from app.models.execution import ExecutionCreate, ExecutionInDB, ExecutionStep
 from app.services.node_service import NodeService
 from app.services.langchain_service import LangChainService
+from app.services.llm_cache import llm_response_cache
+from app.services.event_bus import event_bus
+from app.services.execution_recorder import ExecutionRecorder, StepCollector
+from app.services.llm_usage import rollup_usage, usage_summary_pipelines
+from app.services.job_queue import JobQueue
+from app.services.execution_registry import ExecutionCancelledError, execution_registry
+from app.services.execution_plan import CompiledNode, ExecutionPlan, plan_cache, workflow_revision
+from app.services.node_cache import node_result_cache
+from app.services.prompt_template import PromptTemplate, compile_template, count_tokens
+from app.services.sandbox import run_custom_code
+from app.services.single_flight import SingleFlight
+from app.services.transform_engine import compile_transform
+from app.services.scheduler import DAGScheduler, current_step, token_sink, workflow_settings
+from app.services.worker_pool import WorkerExecutionError, worker_pool
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+webhook_flights = SingleFlight("webhook")
+
 class ExecutionService:
     def __init__(self):
         self.langchain_service = LangChainService()
 
     async def execute_workflow(self, workflow_id: str, user_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a workflow and return the result"""
+        plan = await self._load_plan(workflow_id, user_id)
+        
+        # Create execution record
+        execution_id = await self._create_execution(plan, user_id, input_data)
+        
+        return await self._run_execution(plan, execution_id, input_data)
+
+    async def enqueue_workflow(self, workflow_id: str, user_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a workflow execution for a worker and return its id immediately"""
+        # Compiling up front rejects missing or invalid workflows synchronously
+        plan = await self._load_plan(workflow_id, user_id)
+        
+        execution_id = await self._create_execution(plan, user_id, input_data, status="queued")
+        await JobQueue.enqueue(execution_id, workflow_id, user_id, input_data)
+        
+        return {
+            "execution_id": str(execution_id),
+            "status": "queued"
+        }
+
+    async def run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the execution of a job leased from the queue"""
+        db = get_database()
+        
+        try:
+            plan = await self._load_plan(job["workflow_id"], str(job["user_id"]))
+        except Exception as e:
+            # The workflow was deleted or no longer compiles; without this the
+            # execution would stay queued and look cancellable forever
+            await db.executions.update_one(
+                {"_id": job["execution_id"]},
+                {"$set": {"status": "failed", "error_message": str(e), "updated_at": datetime.utcnow()}}
+            )
+            raise
+        
+        # A reclaimed job may carry steps of a worker that died mid-run, and
+        # the workflow may have changed since the job was queued. The run id
+        # keeps a previous run that has not stopped yet from writing to it.
+        run_id = ObjectId()
+        result = await db.executions.update_one(
+            {"_id": job["execution_id"], "cancel_requested": {"$ne": True}},
+            {"$set": {
+                "status": "running",
+                "steps": [],
+                "revision": list(plan.revision),
+                "run_id": run_id,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        
+        if result.matched_count == 0:
+            await db.executions.update_one(
+                {"_id": job["execution_id"]},
+                {"$set": {"status": "cancelled", "error_message": "Execution cancelled"}}
+            )
+            raise ExecutionCancelledError("Execution cancelled")
+        
+        return await self._run_execution(plan, job["execution_id"], job["input_data"], run_id=run_id)
+
+    async def resume_execution(self, execution_id: str, user_id: str) -> Dict[str, Any]:
+        """Resume a failed or cancelled execution from its last completed steps
+        
+        Completed steps of the original execution are carried over and their
+        nodes are skipped; everything else runs again in a new execution that
+        records the original as ``resumed_from``. A step is only carried over
+        while its node and everything upstream of it are unchanged since the
+        original ran.
+        """
         db = get_database()
         
-        # Get workflow
-        workflow = await db.workflows.find_one({
-            "_id": ObjectId(workflow_id),
+        original = await db.executions.find_one({
+            "_id": ObjectId(execution_id),
             "user_id": ObjectId(user_id)
         })
         
-        if not workflow:
-            raise ValueError("Workflow not found")
+        if not original:
+            raise ValueError("Execution not found")
         
-        # Create execution record
-        execution_data = ExecutionCreate(
+        if original["status"] not in ("failed", "cancelled"):
+            raise ValueError(f"Only failed or cancelled executions can be resumed, this one is {original['status']}")
+        
+        plan = await self._load_plan(original["workflow_id"], user_id)
+        
+        # Carried steps keep their output and usage for the record, but are
+        # marked so usage reports do not count them once per resume. Steps
+        # recorded without a fingerprint run again.
+        completed_steps = [
+            {**step, "carried_over": True}
+            for step in original.get("steps", [])
+            if step["status"] == "completed"
+            and step["node_id"] in plan.index
+            and step.get("fingerprint") == plan.nodes[plan.index[step["node_id"]]].fingerprint
+        ]
+        completed = {step["node_id"]: step.get("output_data") or {} for step in completed_steps}
+        
+        resumed_id = await self._create_execution(
+            plan,
+            user_id,
+            original.get("input_data", {}),
+            steps=completed_steps,
+            resumed_from=str(original["_id"]),
+            root_execution_id=original.get("root_execution_id") or str(original["_id"])
+        )
+        
+        return await self._run_execution(plan, resumed_id, original.get("input_data", {}), completed)
+
+    async def execute_batch(
+        self, workflow_id: str, user_id: str, inputs: AsyncIterator[Any]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Prepare a batch run of one workflow over many inputs
+        
+        The workflow is loaded and compiled once, so a missing workflow fails
+        here; the returned generator yields one result per input as soon as
+        it completes, in completion order.
+        """
+        plan = await self._load_plan(workflow_id, user_id)
+        return self._run_batch(plan, workflow_id, user_id, inputs)
+
+    async def _run_batch(
+        self, plan: ExecutionPlan, workflow_id: str, user_id: str, inputs: AsyncIterator[Any]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Fan batch inputs out over a bounded worker pool"""
+        db = get_database()
+        concurrency = settings.batch_concurrency
+        
+        # A bounded queue keeps a streamed request body from being read far
+        # ahead of the workers
+        pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        finished: asyncio.Queue = asyncio.Queue()
+        records = []
+        
+        async def produce():
+            index = 0
+            async for item in inputs:
+                await pending.put((index, item))
+                index += 1
+        
+        async def work():
+            while True:
+                job = await pending.get()
+                if job is None:
+                    return
+                index, item = job
+                await finished.put(
+                    await self._run_batch_item(plan, workflow_id, user_id, index, item, records)
+                )
+        
+        async def supervise():
+            try:
+                await producer
+            except Exception as e:
+                await finished.put(e)
+            finally:
+                for _ in workers:
+                    await pending.put(None)
+                await asyncio.gather(*workers)
+                await finished.put(None)
+        
+        async def flush_records():
+            if records:
+                batch = records[:]
+                del records[:]
+                await db.executions.insert_many(batch, ordered=False)
+        
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+        supervisor = asyncio.create_task(supervise())
+        
+        try:
+            while True:
+                result = await finished.get()
+                if result is None:
+                    break
+                
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to read batch input: {result}")
+                    yield {"status": "failed", "error": f"Invalid batch input: {result}"}
+                    continue
+                
+                yield result
+                
+                if len(records) >= settings.batch_insert_size:
+                    await flush_records()
+        finally:
+            for task in [producer, supervisor, *workers]:
+                task.cancel()
+            await asyncio.gather(producer, supervisor, *workers, return_exceptions=True)
+            await flush_records()
+
+    async def _run_batch_item(
+        self,
+        plan: ExecutionPlan,
+        workflow_id: str,
+        user_id: str,
+        index: int,
+        input_data: Any,
+        records: list
+    ) -> Dict[str, Any]:
+        """Run one batch input and queue its execution record for insertion"""
+        execution_id = ObjectId()
+        collector = StepCollector()
+        record = ExecutionCreate(
             workflow_id=workflow_id,
-            input_data=input_data
+            input_data=input_data if isinstance(input_data, dict) else {},
+            revision=list(plan.revision)
+        ).dict()
+        record.update(_id=execution_id, user_id=ObjectId(user_id), created_at=datetime.utcnow())
+        
+        try:
+            if not isinstance(input_data, dict):
+                raise ValueError("Batch input must be a JSON object")
+            
+            output = await self._execute_workflow_nodes(plan, input_data, collector)
+            record.update(status="completed", output_data=output)
+            result = {"index": index, "execution_id": str(execution_id), "status": "completed", "output": output}
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}")
+            record.update(status="failed", error_message=str(e))
+            result = {"index": index, "execution_id": str(execution_id), "status": "failed", "error": str(e)}
+        
+        record["steps"] = collector.steps
+        record["llm_usage"] = rollup_usage(collector.steps)
+        record["updated_at"] = datetime.utcnow()
+        records.append(record)
+        return result
+
+    async def get_usage_summary(
+        self, user_id: str, days: float = 7, limit: int = 10, sort_by: str = "tokens"
+    ) -> Dict[str, Any]:
+        """Get the workflows and nodes of a user that used the most LLM tokens or time"""
+        if sort_by not in ("tokens", "time"):
+            raise ValueError("sort_by must be tokens or time")
+        
+        db = get_database()
+        since = datetime.utcnow() - timedelta(days=days)
+        match = {"user_id": ObjectId(user_id), "created_at": {"$gte": since}}
+        workflows, nodes = usage_summary_pipelines(match, sort_by, limit)
+        
+        totals = await db.executions.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": None,
+                "executions": {"$sum": 1},
+                "llm_calls": {"$sum": {"$ifNull": ["$llm_usage.calls", 0]}},
+                "prompt_tokens": {"$sum": {"$ifNull": ["$llm_usage.prompt_tokens", 0]}},
+                "completion_tokens": {"$sum": {"$ifNull": ["$llm_usage.completion_tokens", 0]}},
+                "total_tokens": {"$sum": {"$ifNull": ["$llm_usage.total_tokens", 0]}},
+                "cost": {"$sum": {"$ifNull": ["$llm_usage.cost", 0]}}
+            }},
+            {"$project": {"_id": 0}}
+        ]).to_list(1)
+        
+        return {
+            "since": since,
+            "sort_by": sort_by,
+            "totals": totals[0] if totals else {},
+            "workflows": await db.executions.aggregate(workflows).to_list(limit),
+            "nodes": await db.executions.aggregate(nodes).to_list(limit)
+        }
+
+    async def _create_execution(
+        self, plan: ExecutionPlan, user_id: str, input_data: Dict[str, Any], status: str = "running", **fields
+    ) -> ObjectId:
+        """Insert an execution record of a plan and return its id"""
+        db = get_database()
+        
+        execution_data = ExecutionCreate(
+            workflow_id=plan.workflow_id,
+            input_data=input_data,
+            revision=list(plan.revision)
         )
         
         execution_dict = execution_data.dict()
+        execution_dict.update(fields)
         execution_dict["user_id"] = ObjectId(user_id)
+        execution_dict["status"] = status
+        execution_dict["created_at"] = datetime.utcnow()
         
         result = await db.executions.insert_one(execution_dict)
-        execution_id = result.inserted_id
+        return result.inserted_id
+
+    async def _run_execution(
+        self,
+        plan: ExecutionPlan,
+        execution_id: ObjectId,
+        input_data: Dict[str, Any],
+        completed: Optional[Dict[str, Dict[str, Any]]] = None,
+        run_id: Optional[ObjectId] = None
+    ) -> Dict[str, Any]:
+        """Run a plan for an existing execution record and persist the outcome
+        
+        The nodes run in a task registered under the execution id, so that
+        ``cancel_execution`` can cancel them from another request.
+        """
+        recorder = ExecutionRecorder(execution_id, run_id=run_id)
+        task = asyncio.create_task(
+            self._execute_workflow_nodes(plan, input_data, recorder, completed)
+        )
+        execution_registry.register(str(execution_id), task)
         
         try:
-            # Update execution status to running
-            await db.executions.update_one(
-                {"_id": execution_id},
-                {"$set": {"status": "running", "updated_at": datetime.utcnow()}}
-            )
-            
             # Execute workflow nodes
-            execution_result = await self._execute_workflow_nodes(
-                workflow["nodes"], workflow["edges"], input_data, execution_id
-            )
+            execution_result = await task
             
             # Update execution with results
-            await db.executions.update_one(
-                {"_id": execution_id},
-                {
-                    "$set": {
-                        "status": "completed",
-                        "output_data": execution_result,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            await recorder.close(status="completed", output_data=execution_result)
             
             return {
                 "execution_id": str(execution_id),
@@ -69,178 +347,374 @@ class ExecutionService:
                 "output": execution_result
             }
             
+        except asyncio.CancelledError:
+            if not execution_registry.is_cancel_requested(str(execution_id)):
+                task.cancel()
+                await self._interrupt(recorder, task)
+                raise
+            
+            await recorder.close(status="cancelled", error_message="Execution cancelled")
+            raise ExecutionCancelledError("Execution cancelled")
+            
         except Exception as e:
             logger.error(f"Workflow execution failed: {e}")
             
             # Update execution with error
-            await db.executions.update_one(
-                {"_id": execution_id},
-                {
-                    "$set": {
-                        "status": "failed",
-                        "error_message": str(e),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            await recorder.close(status="failed", error_message=str(e))
             
             raise
+        
+        finally:
+            execution_registry.unregister(str(execution_id))
+
+    @staticmethod
+    async def _interrupt(recorder: ExecutionRecorder, task: Optional[asyncio.Task] = None):
+        """Record an execution that was cancelled without a user request as failed
+        
+        Such as when the process shuts down or a worker loses the lease of
+        its job; otherwise it would stay running, with a pending flush.
+        """
+        try:
+            if task is not None:
+                # Steps the nodes record while they are cancelled go in the final flush
+                await asyncio.wait([task])
+            await asyncio.shield(recorder.close(status="failed", error_message="Execution interrupted"))
+        except Exception as e:
+            logger.error(f"Failed to record interrupted execution {recorder.execution_id}: {e}")
+
+    async def cancel_execution(self, execution_id: str, user_id: str) -> Dict[str, Any]:
+        """Cancel a queued or running execution"""
+        db = get_database()
+        
+        execution = await db.executions.find_one_and_update(
+            {
+                "_id": ObjectId(execution_id),
+                "user_id": ObjectId(user_id),
+                "status": {"$in": ["queued", "running"]}
+            },
+            {"$set": {"cancel_requested": True, "updated_at": datetime.utcnow()}}
+        )
+        
+        if not execution:
+            raise ValueError("Execution not found or already finished")
+        
+        if execution["status"] == "queued":
+            # Jobs that no worker has leased yet are cancelled right here
+            result = await db.execution_jobs.update_one(
+                {"execution_id": execution["_id"], "status": "queued"},
+                {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}}
+            )
+            if result.modified_count:
+                await db.executions.update_one(
+                    {"_id": execution["_id"]},
+                    {"$set": {"status": "cancelled", "error_message": "Execution cancelled"}}
+                )
+                return {"execution_id": execution_id, "status": "cancelled"}
+        
+        # Executions running in another process are cancelled by their worker
+        # once it sees cancel_requested
+        execution_registry.cancel(execution_id)
+        
+        return {"execution_id": execution_id, "status": "cancelling"}
 
     async def execute_workflow_stream(
         self, workflow_id: str, user_id: str, input_data: Dict[str, Any]
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """Execute workflow with streaming updates"""
+        execution_id = await self.start_streaming_execution(workflow_id, user_id, input_data)
+        
+        async for update in event_bus.subscribe(execution_id):
+            yield update
+
+    async def start_streaming_execution(self, workflow_id: str, user_id: str, input_data: Dict[str, Any]) -> str:
+        """Start a persisted execution whose updates are published on the event bus
+        
+        The execution runs in its own task, so it keeps running and recording
+        when the client that started it goes away.
+        """
+        plan = await self._load_plan(workflow_id, user_id)
+        execution_id = await self._create_execution(plan, user_id, input_data)
+        
+        event_bus.open(str(execution_id))
+        task = asyncio.create_task(self._run_streaming_execution(plan, execution_id, input_data))
+        execution_registry.register(str(execution_id), task)
+        
+        return str(execution_id)
+
+    async def _run_streaming_execution(self, plan: ExecutionPlan, execution_id: ObjectId, input_data: Dict[str, Any]):
+        """Run a plan, publishing every update and persisting the outcome"""
+        key = str(execution_id)
+        recorder = ExecutionRecorder(execution_id)
+        results: Dict[str, Any] = {}
+        
+        try:
+            event_bus.publish(key, {"type": "status", "message": "Starting workflow execution"})
+            
+            # Execute nodes and publish progress
+            async for update in self._execute_workflow_nodes_stream(plan, input_data, recorder):
+                if update["type"] == "node_complete":
+                    results[update["node_id"]] = update["result"]
+                event_bus.publish(key, update)
+            
+            await recorder.close(status="completed", output_data=results)
+            event_bus.publish(key, {"type": "execution_complete", "output": results})
+            
+        except asyncio.CancelledError:
+            if not execution_registry.is_cancel_requested(key):
+                await self._interrupt(recorder)
+                event_bus.publish(key, {"type": "execution_error", "error": "Execution interrupted"})
+                raise
+            
+            await recorder.close(status="cancelled", error_message="Execution cancelled")
+            event_bus.publish(key, {"type": "execution_cancelled"})
+            
+        except Exception as e:
+            logger.error(f"Workflow execution failed: {e}")
+            
+            await recorder.close(status="failed", error_message=str(e))
+            event_bus.publish(key, {"type": "execution_error", "error": str(e)})
+        
+        finally:
+            execution_registry.unregister(key)
+            event_bus.close(key)
+
+    async def attach_execution_stream(
+        self, execution_id: str, user_id: str, last_event_id: int = 0
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream the updates of an existing execution after the given event id
+        
+        Executions that are no longer on the event bus, or run in another
+        process, yield their persisted state instead; nothing is re-run.
+        """
         db = get_database()
         
-        workflow = await db.workflows.find_one({
-            "_id": ObjectId(workflow_id),
-            "user_id": ObjectId(user_id)
-        })
+        execution = await db.executions.find_one(
+            {"_id": ObjectId(execution_id), "user_id": ObjectId(user_id)},
+            {"status": 1, "output_data": 1, "error_message": 1}
+        )
+        
+        if not execution:
+            raise ValueError("Execution not found")
+        
+        if event_bus.has_channel(execution_id):
+            async for update in event_bus.subscribe(execution_id, last_event_id):
+                yield update
+            return
+        
+        yield {
+            "type": "execution_state",
+            "execution_id": execution_id,
+            "status": execution["status"],
+            "output": execution.get("output_data"),
+            "error": execution.get("error_message")
+        }
+
+    async def _load_plan(self, workflow_id: str, user_id: str) -> ExecutionPlan:
+        """Get the compiled execution plan of a workflow, compiling it on a cache miss"""
+        db = get_database()
+        
+        # Only the revision is needed to validate a cached plan
+        workflow = await db.workflows.find_one(
+            {"_id": ObjectId(workflow_id), "user_id": ObjectId(user_id)},
+            {"revision": 1, "updated_at": 1}
+        )
         
         if not workflow:
             raise ValueError("Workflow not found")
         
-        yield {"type": "status", "message": "Starting workflow execution"}
+        plan = plan_cache.get(workflow_id, workflow_revision(workflow))
+        if plan is not None:
+            return plan
         
-        # Execute nodes and yield progress
-        async for update in self._execute_workflow_nodes_stream(
-            workflow["nodes"], workflow["edges"], input_data
-        ):
-            yield update
+        workflow = await db.workflows.find_one(
+            {"_id": ObjectId(workflow_id)},
+            {"nodes": 1, "edges": 1, "settings": 1, "revision": 1, "updated_at": 1}
+        )
+        
+        if not workflow:
+            raise ValueError("Workflow not found")
+        
+        plan = ExecutionPlan.compile(
+            workflow_id,
+            workflow_revision(workflow),
+            workflow["nodes"],
+            workflow["edges"],
+            self.node_handlers,
+            workflow.get("settings") or {}
+        )
+        plan_cache.put(plan)
+        return plan
 
     async def _execute_workflow_nodes(
-        self, nodes: list, edges: list, input_data: Dict[str, Any], execution_id: ObjectId
+        self,
+        plan: ExecutionPlan,
+        input_data: Dict[str, Any],
+        recorder: Union[ExecutionRecorder, StepCollector],
+        completed: Optional[Dict[str, Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
-        """Execute workflow nodes in order"""
-        db = get_database()
+        """Execute workflow nodes, in a worker process when the process pool is running"""
+        if not worker_pool.running:
+            return await self.execute_plan(plan, input_data, recorder, completed)
         
-        # Build execution graph
-        node_map = {node["id"]: node for node in nodes}
-        execution_order = self._get_execution_order(nodes, edges)
+        try:
+            results, steps = await worker_pool.execute(plan, input_data, completed)
+        except WorkerExecutionError as e:
+            for step in e.steps:
+                await recorder.add_step(step)
+            raise
         
-        current_data = input_data
-        results = {}
+        for step in steps:
+            await recorder.add_step(step)
+        return results
+
+    async def execute_plan(
+        self,
+        plan: ExecutionPlan,
+        input_data: Dict[str, Any],
+        recorder: Union[ExecutionRecorder, StepCollector],
+        completed: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Execute workflow nodes in this process, running independent branches concurrently"""
+        scheduler = DAGScheduler(plan, self._execute_single_node)
+        results = dict(completed or {})
         
-        for node_id in execution_order:
-            node = node_map[node_id]
+        async for event in scheduler.run(input_data, completed):
+            if event["type"] in ("node_start", "node_token"):
+                continue
             
-            # Create execution step
-            step = ExecutionStep(
-                node_id=node_id,
-                node_type=node["data"]["type"],
-                status="running",
-                input_data=current_data,
-                started_at=datetime.utcnow()
-            )
-            
-            try:
-                # Execute node
-                node_result = await self._execute_single_node(node, current_data)
-                
-                step.status = "completed"
-                step.output_data = node_result
-                step.completed_at = datetime.utcnow()
-                
-                results[node_id] = node_result
-                current_data = {**current_data, **node_result}
-                
-            except Exception as e:
-                step.status = "failed"
-                step.error_message = str(e)
-                step.completed_at = datetime.utcnow()
-                
-                logger.error(f"Node {node_id} execution failed: {e}")
-                raise
+            if event["type"] == "node_complete":
+                results[event["node_id"]] = event["result"]
             
-            # Update execution with step
-            await db.executions.update_one(
-                {"_id": execution_id},
-                {"$push": {"steps": step.dict()}}
-            )
+            # Buffer the step; the recorder writes steps in batches
+            await recorder.add_step(self._build_step(plan, event))
         
         return results
 
+    @staticmethod
+    def _build_step(plan: ExecutionPlan, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Create the execution step of a finished node from its scheduler event"""
+        # Only the node's own output is stored; its input is rebuilt from the
+        # parent steps when history is read
+        node = plan.nodes[event["index"]]
+        step = ExecutionStep(
+            node_id=event["node_id"],
+            node_type=event["node_type"],
+            status="running",
+            parent_node_ids=[plan.nodes[parent].id for parent in node.parents],
+            position=node.index,
+            fingerprint=node.fingerprint,
+            started_at=event["started_at"],
+            completed_at=event["completed_at"],
+            **event["step"]
+        )
+        
+        if event["type"] == "node_complete":
+            step.status = "completed"
+            step.output_data = event["result"]
+        else:
+            step.status = "failed"
+            step.error_message = str(event["error"])
+            logger.error(f"Node {event['node_id']} execution failed: {event['error']}")
+        
+        return step.dict()
+
     async def _execute_workflow_nodes_stream(
-        self, nodes: list, edges: list, input_data: Dict[str, Any]
+        self, plan: ExecutionPlan, input_data: Dict[str, Any], recorder: ExecutionRecorder
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        """Execute workflow nodes with streaming updates"""
-        node_map = {node["id"]: node for node in nodes}
-        execution_order = self._get_execution_order(nodes, edges)
-        
-        current_data = input_data
+        """Execute workflow nodes with streaming updates, recording their steps"""
+        scheduler = DAGScheduler(plan, self._execute_single_node, stream_tokens=True)
+        total = len(plan)
+        completed = 0
         
-        for i, node_id in enumerate(execution_order):
-            node = node_map[node_id]
+        async for event in scheduler.run(input_data):
+            if event["type"] in ("node_complete", "node_error"):
+                await recorder.add_step(self._build_step(plan, event))
             
-            yield {
-                "type": "node_start",
-                "node_id": node_id,
-                "node_type": node["data"]["type"],
-                "progress": i / len(execution_order)
-            }
+            if event["type"] == "node_start":
+                yield {
+                    "type": "node_start",
+                    "node_id": event["node_id"],
+                    "node_type": event["node_type"],
+                    "progress": completed / total
+                }
             
-            try:
-                node_result = await self._execute_single_node(node, current_data)
-                current_data = {**current_data, **node_result}
-                
+            elif event["type"] == "node_token":
+                yield {
+                    "type": "node_token",
+                    "node_id": event["node_id"],
+                    "token": event["token"]
+                }
+            
+            elif event["type"] == "node_complete":
+                completed += 1
                 yield {
                     "type": "node_complete",
-                    "node_id": node_id,
-                    "result": node_result,
-                    "progress": (i + 1) / len(execution_order)
+                    "node_id": event["node_id"],
+                    "result": event["result"],
+                    "progress": completed / total
                 }
-                
-            except Exception as e:
+            
+            else:
                 yield {
                     "type": "node_error",
-                    "node_id": node_id,
-                    "error": str(e)
+                    "node_id": event["node_id"],
+                    "error": str(event["error"])
                 }
-                raise
 
-    async def _execute_single_node(self, node: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute a single node"""
-        node_type = node["data"]["type"]
-        node_config = node["data"].get("config", {})
-        
-        if node_type == "trigger":
-            return {"triggered": True, "timestamp": datetime.utcnow().isoformat()}
+    async def _execute_single_node(self, node: CompiledNode, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a single node, serving cacheable nodes from the result cache"""
+        if not node_result_cache.is_enabled(node.type, node.config):
+            return await node.handler(self, node.config, input_data)
         
-        elif node_type == "chatbot":
-            return await self._execute_chatbot_node(node_config, input_data)
+        key = node_result_cache.make_key(node.type, node.config, input_data)
+        cached = await node_result_cache.get(key)
+        if cached is not None:
+            current_step.get({}).update(cache_hit=True, saved_ms=cached["duration_ms"])
+            return cached["result"]
         
-        elif node_type == "database":
-            return await self._execute_database_node(node_config, input_data)
+        start = time.perf_counter()
+        result = await node.handler(self, node.config, input_data)
         
-        elif node_type == "email":
-            return await self._execute_email_node(node_config, input_data)
+        # Failures reported as results must not be replayed from the cache
+        if "error" not in result:
+            await node_result_cache.set(key, result, (time.perf_counter() - start) * 1000)
         
-        elif node_type == "webhook":
-            return await self._execute_webhook_node(node_config, input_data)
-        
-        elif node_type == "ai":
-            return await self._execute_ai_node(node_config, input_data)
-        
-        elif node_type == "code":
-            return await self._execute_code_node(node_config, input_data)
-        
-        elif node_type == "transform":
-            return await self._execute_transform_node(node_config, input_data)
-        
-        else:
-            raise ValueError(f"Unknown node type: {node_type}")
+        return result
+
+    async def _execute_trigger_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute trigger node"""
+        return {"triggered": True, "timestamp": datetime.utcnow().isoformat()}
 
     async def _execute_chatbot_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute chatbot node using LangChain"""
         try:
+            api_key = config.get("openai_api_key")
+            model = config.get("model", "gpt-3.5-turbo")
+            temperature = config.get("temperature", 0.7)
+            system_prompt = config.get("system_prompt", "You are a helpful assistant.")
+            
+            # The user message is a template over the input fields, kept
+            # within the node's token budget next to the system prompt
+            if "user_prompt" in config:
+                template = compile_template(config["user_prompt"])
+            else:
+                template = compile_template("{message}" if "message" in input_data else "Hello")
+            prompt = await template.render(
+                input_data,
+                **self.langchain_service.prompt_options(config, api_key, model, count_tokens(system_prompt))
+            )
+            current_step.get({}).update(prompt_tokens=prompt.tokens, prompt_truncated=prompt.truncated)
+            
             response = await self.langchain_service.chat_completion(
-                api_key=config.get("openai_api_key"),
-                model=config.get("model", "gpt-3.5-turbo"),
+                api_key=api_key,
+                model=model,
                 messages=[
-                    {"role": "system", "content": config.get("system_prompt", "You are a helpful assistant.")},
-                    {"role": "user", "content": input_data.get("message", "Hello")}
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt.text}
                 ],
-                temperature=config.get("temperature", 0.7)
+                temperature=temperature,
+                on_token=token_sink.get(),
+                use_cache=llm_response_cache.is_enabled(workflow_settings.get(), config, temperature)
             )
             
             return {
@@ -263,43 +737,59 @@ class ExecutionService:
 
     async def _execute_webhook_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute webhook node"""
+        # Identical requests in flight share one upstream call; only
+        # idempotent methods are coalesced unless the node says otherwise
+        method = config.get("method", "GET").upper()
+        if not config.get("coalesce", method in ("GET", "HEAD")):
+            return await self._send_webhook(config, input_data)
+        
+        key = SingleFlight.make_key(config, dict(input_data))
+        result = await webhook_flights.do(key, lambda: self._send_webhook(config, input_data))
+        return dict(result)
+
+    async def _send_webhook(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send the HTTP request of a webhook node"""
         # Implementation for HTTP requests
         return {"webhook_response": "Request completed"}
 
     async def _execute_ai_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute AI processing node"""
-        return await self.langchain_service.process_with_ai(config, input_data)
+        return await self.langchain_service.process_with_ai(config, input_data, on_token=token_sink.get())
 
     async def _execute_code_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute custom code node"""
-        # Implementation for custom Python code execution
-        return {"code_result": "Custom code executed"}
+        code = config.get("code")
+        if not code:
+            raise ValueError("Code node requires code")
+        
+        result = await run_custom_code(code, dict(input_data), config.get("requirements", []), config.get("timeout"))
+        return {"code_result": result}
 
     async def _execute_transform_node(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute data transformation node"""
-        # Implementation for data transformation
-        return {"transformed_data": input_data}
-
-    def _get_execution_order(self, nodes: list, edges: list) -> list:
-        """Get the execution order of nodes based on edges"""
-        # Simple topological sort
-        in_degree = {node["id"]: 0 for node in nodes}
-        graph = {node["id"]: [] for node in nodes}
-        
-        for edge in edges:
-            graph[edge["source"]].append(edge["target"])
-            in_degree[edge["target"]] += 1
-        
-        queue = [node_id for node_id, degree in in_degree.items() if degree == 0]
-        result = []
+        transform = compile_transform(config.get("transformation", "map"), config.get("expression", ""))
         
-        while queue:
-            node_id = queue.pop(0)
-            result.append(node_id)
-            
-            for neighbor in graph[node_id]:
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
+        field = config.get("field", "items")
+        records = PromptTemplate.resolve(tuple(field.split(".")), input_data)
+        if not isinstance(records, list):
+            raise ValueError(f"Transform input field {field} is not a list")
         
-        return result
\ No newline at end of file
+        # Large inputs are transformed off the event loop
+        descending = bool(config.get("descending", False))
+        if len(records) >= settings.transform_batch_size:
+            result = await asyncio.to_thread(transform.apply, records, descending)
+        else:
+            result = transform.apply(records, descending)
+        return {"transformed_data": result}
+
+    # Node handlers are resolved once per plan instead of per node execution
+    node_handlers = {
+        "trigger": _execute_trigger_node,
+        "chatbot": _execute_chatbot_node,
+        "database": _execute_database_node,
+        "email": _execute_email_node,
+        "webhook": _execute_webhook_node,
+        "ai": _execute_ai_node,
+        "code": _execute_code_node,
+        "transform": _execute_transform_node,
+    }
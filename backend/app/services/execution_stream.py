@@ -0,0 +1,137 @@
+import asyncio
+import json
+from typing import Dict, Any
+from fastapi import WebSocket
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.execution_service import ExecutionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExecutionStreamSession:
+    """Multiplexed execution updates over one WebSocket connection
+
+    Clients start, subscribe to and cancel any number of executions on the
+    same connection; every update carries the id of its execution. Each
+    subscription forwards events from the event bus into one bounded send
+    queue drained by a single writer task. A slow client therefore only
+    stalls its own subscriptions, which then catch up from the event bus
+    buffer, never the executions themselves.
+
+    All messages act on behalf of the user the connection was authenticated
+    as, never a user named by the client.
+
+    Messages:
+        {"type": "execute", "workflow_id"?, "input_data", "request_id"?}
+        {"type": "subscribe", "execution_id", "last_event_id"?}
+        {"type": "unsubscribe", "execution_id"}
+        {"type": "cancel", "execution_id"}
+    """
+
+    def __init__(self, websocket: WebSocket, workflow_id: str, user_id: str):
+        self.websocket = websocket
+        self.workflow_id = workflow_id
+        self.user_id = user_id
+        self.execution_service = ExecutionService()
+        self.outgoing: asyncio.Queue = asyncio.Queue(maxsize=settings.websocket_send_queue_size)
+        self.subscriptions: Dict[str, asyncio.Task] = {}
+
+    async def run(self):
+        """Handle client messages until the connection closes"""
+        reader = asyncio.create_task(self._read())
+        writer = asyncio.create_task(self._write())
+
+        try:
+            # A failed send means the connection is gone; stop reading as well
+            # instead of waiting on a send queue nobody drains. Cancelling
+            # run itself, as on shutdown, still propagates from here.
+            done, _ = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+            if reader not in done:
+                logger.info(f"WebSocket send failed: {writer.exception()}")
+                return
+            reader.result()
+        finally:
+            reader.cancel()
+            writer.cancel()
+            for task in self.subscriptions.values():
+                task.cancel()
+
+    async def _read(self):
+        while True:
+            message = json.loads(await self.websocket.receive_text())
+            await self._handle(message)
+
+    async def _write(self):
+        while True:
+            update = await self.outgoing.get()
+            await self.websocket.send_text(json.dumps(update, default=str))
+
+    async def _send(self, update: Dict[str, Any]):
+        if self.outgoing.full():
+            metrics.increment("websocket.send_queue_full")
+        await self.outgoing.put(update)
+
+    async def _handle(self, message: Dict[str, Any]):
+        message_type = message.get("type")
+        execution_id = message.get("execution_id")
+
+        try:
+            if message_type == "execute":
+                workflow_id = message.get("workflow_id", self.workflow_id)
+                execution_id = await self.execution_service.start_streaming_execution(
+                    workflow_id, self.user_id, message.get("input_data", {})
+                )
+                await self._send({
+                    "type": "execution_started",
+                    "execution_id": execution_id,
+                    "workflow_id": workflow_id,
+                    "request_id": message.get("request_id")
+                })
+                self._subscribe(execution_id)
+
+            elif message_type in ("subscribe", "attach"):
+                self._subscribe(execution_id, message.get("last_event_id", 0))
+
+            elif message_type == "unsubscribe":
+                task = self.subscriptions.pop(execution_id, None)
+                if task is not None:
+                    task.cancel()
+
+            elif message_type == "cancel":
+                result = await self.execution_service.cancel_execution(execution_id, self.user_id)
+                await self._send({"type": "cancel_result", **result})
+
+            else:
+                raise ValueError(f"Unknown message type: {message_type}")
+
+        except Exception as e:
+            logger.error(f"WebSocket message {message_type} failed: {e}")
+            await self._send({
+                "type": "error",
+                "execution_id": execution_id,
+                "request_id": message.get("request_id"),
+                "error": str(e)
+            })
+
+    def _subscribe(self, execution_id: str, last_event_id: int = 0):
+        previous = self.subscriptions.get(execution_id)
+        if previous is not None:
+            previous.cancel()
+
+        self.subscriptions[execution_id] = asyncio.create_task(
+            self._forward(execution_id, last_event_id)
+        )
+
+    async def _forward(self, execution_id: str, last_event_id: int):
+        """Forward the updates of one execution into the send queue"""
+        try:
+            async for update in self.execution_service.attach_execution_stream(
+                execution_id, self.user_id, last_event_id
+            ):
+                await self._send(update)
+        except Exception as e:
+            await self._send({"type": "error", "execution_id": execution_id, "error": str(e)})
+        finally:
+            if self.subscriptions.get(execution_id) is asyncio.current_task():
+                del self.subscriptions[execution_id]
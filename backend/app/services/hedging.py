@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Awaitable, Callable, Optional, TypeVar
+from app.core.config import settings
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Recent latencies kept per model, and how many are needed before hedging
+_WINDOW = 500
+_MIN_SAMPLES = 20
+
+# Hedge credits a model can save up while its calls are fast
+_MAX_CREDITS = 10.0
+
+class _ModelLatency:
+    __slots__ = ("samples", "credits")
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=_WINDOW)
+        self.credits = 0.0
+
+class _Attempt:
+    __slots__ = ("sent", "sent_at")
+
+    def __init__(self):
+        self.sent = asyncio.Event()
+        self.sent_at: Optional[float] = None
+
+# Attempt of the hedged call running in the current task
+_current_attempt: ContextVar[Optional[_Attempt]] = ContextVar("hedge_attempt", default=None)
+
+def mark_sent():
+    """Tell the hedger that the current attempt is being sent to the provider
+
+    Latencies and the hedge timer start here, so time spent queued in the
+    rate limiter is not taken for a slow provider.
+    """
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.sent_at = time.perf_counter()
+        attempt.sent.set()
+
+class RequestHedger:
+    """Send a duplicate of a slow call and take whichever answers first
+
+    A call that has not returned after the ``LLM_HEDGE_PERCENTILE``
+    percentile of its model's recent latencies gets a second attempt; the
+    first response wins and the other attempt is cancelled. Every call earns
+    ``LLM_HEDGE_BUDGET`` credits and every hedge spends one, so hedges stay
+    a bounded fraction of the traffic. Latencies are measured from
+    ``mark_sent``, and no hedge is sent while ``can_hedge`` says the
+    provider's limits are already queueing calls.
+    """
+
+    def __init__(self, percentile: float, budget: float):
+        self.percentile = percentile
+        self.budget = budget
+        self.models: Dict[str, _ModelLatency] = {}
+
+    def _threshold(self, stats: _ModelLatency) -> Optional[float]:
+        if self.percentile <= 0 or len(stats.samples) < _MIN_SAMPLES:
+            return None
+        ordered = sorted(stats.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    @staticmethod
+    def _start(attempt: _Attempt, call: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        async def run_attempt() -> T:
+            _current_attempt.set(attempt)
+            return await call()
+
+        return asyncio.create_task(run_attempt())
+
+    async def run(
+        self, model: str, call: Callable[[], Awaitable[T]], can_hedge: Optional[Callable[[], bool]] = None
+    ) -> T:
+        """Run a call, hedging it once it is slower than usual"""
+        stats = self.models.get(model)
+        if stats is None:
+            stats = self.models[model] = _ModelLatency()
+        stats.credits = min(_MAX_CREDITS, stats.credits + self.budget)
+
+        threshold = self._threshold(stats)
+        start = time.perf_counter()
+        first = _Attempt()
+        attempts = {self._start(first, call): first}
+        sent = None
+
+        try:
+            if threshold is not None:
+                # The timer starts once the first attempt is sent
+                sent = asyncio.create_task(first.sent.wait())
+                done, _ = await asyncio.wait({*attempts, sent}, return_when=asyncio.FIRST_COMPLETED)
+                if first.sent.is_set() and not done - {sent}:
+                    done, _ = await asyncio.wait(attempts, timeout=threshold - (time.perf_counter() - first.sent_at))
+                    if not done and stats.credits >= 1:
+                        if can_hedge is None or can_hedge():
+                            stats.credits -= 1
+                            second = _Attempt()
+                            attempts[self._start(second, call)] = second
+                            metrics.increment("llm_hedging.hedged")
+                        else:
+                            # A hedge would only queue behind the calls already waiting
+                            metrics.increment("llm_hedging.skipped")
+
+            # The first successful attempt wins; a failure only counts once
+            # no other attempt is left
+            tasks = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None or not pending:
+                    break
+                tasks = pending
+
+            if winner is None:
+                return next(iter(done)).result()
+
+            attempt = attempts[winner]
+            if attempt is not first:
+                metrics.increment("llm_hedging.hedge_wins")
+            stats.samples.append(time.perf_counter() - (attempt.sent_at or start))
+            return winner.result()
+        finally:
+            if sent is not None:
+                sent.cancel()
+            for task in attempts:
+                task.cancel()
+
+llm_hedger = RequestHedger(settings.llm_hedge_percentile, settings.llm_hedge_budget)
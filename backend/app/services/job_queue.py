@@ -0,0 +1,88 @@
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """Mongo-backed queue of executions waiting for a worker
+
+    Workers lease jobs atomically with ``find_one_and_update``. A lease has
+    to be renewed by heartbeats; once it expires the job can be leased by
+    another worker, so jobs of crashed workers are reclaimed automatically.
+    """
+
+    @staticmethod
+    async def enqueue(execution_id: ObjectId, workflow_id: str, user_id: str, input_data: Dict[str, Any]) -> ObjectId:
+        """Add a job for an existing execution record"""
+        db = get_database()
+
+        result = await db.execution_jobs.insert_one({
+            "execution_id": execution_id,
+            "workflow_id": workflow_id,
+            "user_id": ObjectId(user_id),
+            "input_data": input_data,
+            "status": "queued",
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "created_at": datetime.utcnow()
+        })
+        return result.inserted_id
+
+    @staticmethod
+    async def lease(worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the oldest queued or abandoned job"""
+        db = get_database()
+        now = datetime.utcnow()
+
+        return await db.execution_jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "leased", "lease_expires_at": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {
+                    "status": "leased",
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    async def heartbeat(job_id: ObjectId, worker_id: str) -> bool:
+        """Extend a lease; returns False if the worker no longer holds it"""
+        db = get_database()
+
+        result = await db.execution_jobs.update_one(
+            {"_id": job_id, "lease_owner": worker_id, "status": "leased"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=settings.job_lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    @staticmethod
+    async def finish(job_id: ObjectId, worker_id: str, status: str, error_message: Optional[str] = None):
+        """Release a lease and record the final job status"""
+        db = get_database()
+
+        await db.execution_jobs.update_one(
+            {"_id": job_id, "lease_owner": worker_id},
+            {
+                "$set": {
+                    "status": status,
+                    "error_message": error_message,
+                    "lease_expires_at": None,
+                    "finished_at": datetime.utcnow()
+                }
+            }
+        )
@@ -1,9 +1,23 @@
-from typing import Dict, Any, List
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Mapping, Optional
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain.schema.runnable import Runnable, RunnableConfig
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from typing_extensions import Annotated, TypedDict
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.hedging import llm_hedger, mark_sent
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_pool import llm_client_pool
+from app.services.llm_usage import message_usage, record_llm_call
+from app.services.prompt_template import OVERFLOW_STRATEGIES, compile_template, count_tokens, truncate_tokens
+from app.services.rate_limiter import llm_rate_limiter, report_tokens
+from app.services.scheduler import current_step
+from app.services.single_flight import SingleFlight
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,75 +25,254 @@ logger = logging.getLogger(__name__)
 class ChatState(TypedDict):
     messages: Annotated[list, add_messages]
 
-class LangChainService:
-    def __init__(self):
-        self.chat_models = {}
+class AIState(TypedDict):
+    input: Mapping[str, Any]
+    prompt_tokens: int
+    prompt_truncated: bool
+    messages: Annotated[list, add_messages]
+
+def build_ai_graph(model: str, prompt: str):
+    """Compile the graph of an AI node with the given model and prompt template"""
+    template = compile_template(prompt)
+    
+    async def format_prompt(state: AIState, config: RunnableConfig):
+        # Format prompt with the input fields it references, within the node's token budget
+        rendered = await template.render(state["input"], **config["configurable"]["prompt_options"])
+        return {
+            "messages": [HumanMessage(content=rendered.text)],
+            "prompt_tokens": rendered.tokens,
+            "prompt_truncated": rendered.truncated
+        }
+    
+    async def chatbot(state: AIState, config: RunnableConfig):
+        options = config["configurable"]
+        chat_model = llm_client_pool.get(options["api_key"], model)
+        on_token = options.get("on_token")
+        
+        async def send():
+            start = time.perf_counter()
+            if on_token is None:
+                message = await chat_model.ainvoke(state["messages"])
+            else:
+                message = await LangChainService._stream_message(chat_model, state["messages"], on_token)
+            record_llm_call(model, *message_usage(message, prompt), (time.perf_counter() - start) * 1000)
+            return message
+        
+        prompt = "".join(str(message.content) for message in state["messages"])
+        return {"messages": [await llm_rate_limiter.run(options["api_key"], model, prompt, send)]}
+    
+    # Build the graph
+    workflow = StateGraph(AIState)
+    workflow.add_node("prompt", format_prompt)
+    workflow.add_node("chatbot", chatbot)
+    workflow.set_entry_point("prompt")
+    workflow.add_edge("prompt", "chatbot")
+    workflow.add_edge("chatbot", END)
+    
+    return workflow.compile()
+
+class GraphCache:
+    """LRU of compiled AI node graphs keyed by model and prompt template"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._graphs: OrderedDict = OrderedDict()
+
+    def get(self, model: str, prompt: str):
+        """Get the compiled graph of a model and prompt, compiling it on a miss"""
+        key = (model, prompt)
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self._graphs.move_to_end(key)
+            metrics.increment("ai_graph_cache.hits")
+            return graph
+        
+        metrics.increment("ai_graph_cache.misses")
+        graph = self._graphs[key] = build_ai_graph(model, prompt)
+        while len(self._graphs) > self.max_size:
+            self._graphs.popitem(last=False)
+        return graph
 
+ai_graph_cache = GraphCache(settings.ai_graph_cache_size)
+
+# Streaming calls are not coalesced, since their tokens go to one caller
+chat_flights = SingleFlight("chat_completion")
+ai_flights = SingleFlight("process_with_ai")
+
+class LangChainService:
     def get_chat_model(self, api_key: str, model: str = "gpt-3.5-turbo") -> ChatOpenAI:
-        """Get or create a chat model instance"""
-        key = f"{api_key}_{model}"
-        if key not in self.chat_models:
-            self.chat_models[key] = ChatOpenAI(
-                openai_api_key=api_key,
-                model=model
-            )
-        return self.chat_models[key]
+        """Get the shared chat model instance of an API key and model"""
+        return llm_client_pool.get(api_key, model)
 
     async def chat_completion(
         self, 
         api_key: str, 
         model: str, 
         messages: List[Dict[str, str]], 
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        on_token: Optional[Callable[[str], None]] = None,
+        use_cache: bool = False
     ) -> str:
-        """Generate chat completion using OpenAI"""
+        """Generate chat completion using OpenAI, streaming tokens to on_token if given
+        
+        With use_cache set, the response is served from and stored in the
+        LLM response cache.
+        """
         try:
-            chat_model = self.get_chat_model(api_key, model)
-            chat_model.temperature = temperature
+            if use_cache:
+                cached = await llm_response_cache.get(api_key, model, temperature, messages)
+                if cached is not None:
+                    if on_token is not None:
+                        on_token(cached)
+                    return cached
             
-            # Convert messages to LangChain format
-            langchain_messages = []
-            for msg in messages:
-                if msg["role"] == "system":
-                    langchain_messages.append(SystemMessage(content=msg["content"]))
-                elif msg["role"] == "user":
-                    langchain_messages.append(HumanMessage(content=msg["content"]))
+            if on_token is not None:
+                content = await self._complete(api_key, model, messages, temperature, on_token)
+            else:
+                # Identical calls already in flight share one upstream request
+                key = SingleFlight.make_key(api_key, model, temperature, messages)
+                content = await chat_flights.do(
+                    key, lambda: self._complete(api_key, model, messages, temperature)
+                )
             
-            response = await chat_model.ainvoke(langchain_messages)
-            return response.content
+            if use_cache:
+                await llm_response_cache.set(api_key, model, temperature, messages, content)
+            return content
             
         except Exception as e:
             logger.error(f"Chat completion failed: {e}")
             raise
 
-    async def process_with_ai(self, config: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process data using AI with LangGraph"""
+    def prompt_options(self, config: Dict[str, Any], api_key: str, model: str, reserved_tokens: int = 0) -> Dict[str, Any]:
+        """Get the token budget and overflow handling of a node's prompt
+        
+        ``reserved_tokens`` are taken by other messages of the same call,
+        such as a fixed system prompt.
+        """
+        budget = config.get("max_prompt_tokens", settings.prompt_token_budget)
+        overflow = config.get("prompt_overflow", settings.prompt_overflow)
+        if overflow not in OVERFLOW_STRATEGIES:
+            raise ValueError(f"Unknown prompt overflow strategy: {overflow}")
+        
+        async def summarize(text: str, max_tokens: int) -> str:
+            return await self.chat_completion(
+                api_key,
+                model,
+                [
+                    {"role": "system", "content": (
+                        f"Summarize the user's text in at most {max_tokens} tokens. "
+                        "Keep names, numbers and facts."
+                    )},
+                    {"role": "user", "content": truncate_tokens(text, settings.prompt_summary_input_tokens)}
+                ],
+                temperature=0
+            )
+        
+        return {
+            "budget": max(1, budget - reserved_tokens) if budget > 0 else 0,
+            "overflow": overflow,
+            "summarize": summarize
+        }
+
+    async def _complete(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Send a chat completion request to the provider"""
+        # Generation parameters are bound per call; the pooled model is shared
+        chat_model = self.get_chat_model(api_key, model).bind(temperature=temperature)
+        
+        # Convert messages to LangChain format
+        langchain_messages = []
+        for msg in messages:
+            if msg["role"] == "system":
+                langchain_messages.append(SystemMessage(content=msg["content"]))
+            elif msg["role"] == "user":
+                langchain_messages.append(HumanMessage(content=msg["content"]))
+        
+        async def send() -> str:
+            mark_sent()
+            start = time.perf_counter()
+            try:
+                if on_token is not None:
+                    response = await self._stream_message(chat_model, langchain_messages, on_token)
+                else:
+                    response = await chat_model.ainvoke(langchain_messages)
+            except asyncio.CancelledError:
+                # The prompt of an abandoned call, such as the losing attempt
+                # of a hedge, is billed all the same
+                prompt_tokens = count_tokens(prompt)
+                record_llm_call(model, prompt_tokens, 0, (time.perf_counter() - start) * 1000)
+                report_tokens(prompt_tokens)
+                raise
+            prompt_tokens, completion_tokens = message_usage(response, prompt)
+            record_llm_call(model, prompt_tokens, completion_tokens, (time.perf_counter() - start) * 1000)
+            # The rate limiter admitted the call on an estimate
+            report_tokens(prompt_tokens + completion_tokens)
+            return response.content
+        
+        prompt = "".join(msg["content"] for msg in messages)
+        if on_token is not None:
+            return await llm_rate_limiter.run(api_key, model, prompt, send)
+        
+        # Streamed tokens cannot be taken back, so only whole responses are
+        # hedged, and not while the limiter already queues calls
+        limiter = llm_rate_limiter.get(api_key, model)
+        return await llm_hedger.run(
+            model,
+            lambda: llm_rate_limiter.run(api_key, model, prompt, send),
+            can_hedge=lambda: not limiter.is_queueing()
+        )
+
+    @staticmethod
+    async def _stream_message(
+        chat_model: Runnable, messages: List[BaseMessage], on_token: Callable[[str], None]
+    ) -> AIMessage:
+        """Stream a response token by token and assemble the final message"""
+        content = []
+        async for chunk in chat_model.astream(messages):
+            if chunk.content:
+                content.append(chunk.content)
+                on_token(chunk.content)
+        return AIMessage(content="".join(content))
+
+    async def process_with_ai(
+        self,
+        config: Dict[str, Any],
+        input_data: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """Process data using AI with LangGraph, streaming tokens to on_token if given"""
         try:
-            api_key = config.get("api_key")
             model = config.get("model", "gpt-3.5-turbo")
             prompt = config.get("prompt", "Process this data: {input}")
             
-            # Create a simple LangGraph workflow
-            def chatbot(state: ChatState):
-                chat_model = self.get_chat_model(api_key, model)
-                return {"messages": [chat_model.invoke(state["messages"])]}
-            
-            # Build the graph
-            workflow = StateGraph(ChatState)
-            workflow.add_node("chatbot", chatbot)
-            workflow.set_entry_point("chatbot")
-            workflow.add_edge("chatbot", END)
-            
-            app = workflow.compile()
-            
-            # Format prompt with input data
-            formatted_prompt = prompt.format(input=str(input_data))
+            # The compiled graph is shared by every call with the same shape;
+            # per-call values travel in the run config
+            app = ai_graph_cache.get(model, prompt)
             
             # Run the workflow
-            result = await app.ainvoke({
-                "messages": [HumanMessage(content=formatted_prompt)]
-            })
+            api_key = config.get("api_key")
+            state = {"input": input_data, "messages": []}
+            options = {"configurable": {
+                "api_key": api_key,
+                "on_token": on_token,
+                "prompt_options": self.prompt_options(config, api_key, model)
+            }}
+            if on_token is not None:
+                result = await app.ainvoke(state, options)
+            else:
+                # Identical calls already in flight share one graph run
+                key = SingleFlight.make_key(
+                    api_key, model, prompt, config.get("max_prompt_tokens"), config.get("prompt_overflow"), dict(input_data)
+                )
+                result = await ai_flights.do(key, lambda: app.ainvoke(state, options))
             
+            current_step.get({}).update(prompt_tokens=result["prompt_tokens"], prompt_truncated=result["prompt_truncated"])
             return {
                 "ai_response": result["messages"][-1].content,
                 "processed": True
@@ -116,8 +309,7 @@ class LangChainService:
             chat_model = self.get_chat_model(
                 config.get("openai_api_key"),
                 config.get("model", "gpt-3.5-turbo")
-            )
-            chat_model.temperature = config.get("temperature", 0.7)
+            ).bind(temperature=config.get("temperature", 0.7))
             
             # Add system message if provided
             messages = state["messages"].copy()
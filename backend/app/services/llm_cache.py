@@ -0,0 +1,135 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Mapping, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.node_cache import SQLiteCacheTier
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMResponseCache:
+    """Cache of chat completions keyed by API key, model, temperature and messages
+
+    Entries are scoped to the hash of the API key that made the call, so a
+    response is only ever served to callers of the same account.
+
+    Messages are normalized before hashing (surrounding whitespace stripped,
+    inner whitespace collapsed), so prompts that only differ in formatting
+    share an entry. Each entry also remembers the hash of the exact messages
+    it was stored for, which tells exact hits from normalized ones.
+
+    Lookups go through a bounded in-memory LRU tier first and then an
+    optional SQLite tier with its own size limit. Caching is opt-in: a
+    workflow's ``llm_cache`` setting (or a node's ``llm_cache`` config)
+    enables it, and calls with a temperature above ``llm_cache_max_temperature``
+    bypass it, since their responses are meant to vary.
+    """
+
+    def __init__(self, max_size: int, ttl: float, backend: str = "memory"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        if backend == "sqlite":
+            self.persistent_tier = SQLiteCacheTier(
+                settings.llm_cache_sqlite_path, "llm_response_cache", settings.llm_cache_max_entries
+            )
+        else:
+            self.persistent_tier = None
+
+    def is_enabled(
+        self, workflow_settings: Mapping[str, Any], config: Mapping[str, Any], temperature: float
+    ) -> bool:
+        """Check whether a call may be served from the cache"""
+        if self.max_size <= 0 and self.persistent_tier is None:
+            return False
+
+        options = {**workflow_settings, **{k: v for k, v in config.items() if k.startswith("llm_cache")}}
+        if not options.get("llm_cache", settings.llm_cache_enabled):
+            return False
+
+        if temperature > options.get("llm_cache_max_temperature", settings.llm_cache_max_temperature):
+            metrics.increment("llm_cache.bypassed")
+            return False
+        return True
+
+    @staticmethod
+    def _hash(payload: Any) -> str:
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+
+    @classmethod
+    def make_keys(cls, api_key: str, model: str, temperature: float, messages: List[Dict[str, str]]) -> tuple:
+        """Get the normalized cache key and the exact hash of a call"""
+        scope = hashlib.sha256(api_key.encode()).hexdigest()
+        normalized = [
+            {"role": message["role"], "content": " ".join(message["content"].split())}
+            for message in messages
+        ]
+        key = cls._hash({"scope": scope, "model": model, "temperature": temperature, "messages": normalized})
+        exact = cls._hash({"scope": scope, "model": model, "temperature": temperature, "messages": messages})
+        return key, exact
+
+    async def get(
+        self, api_key: str, model: str, temperature: float, messages: List[Dict[str, str]]
+    ) -> Optional[str]:
+        """Get a cached response of an API key"""
+        key, exact = self.make_keys(api_key, model, temperature, messages)
+        entry = None
+
+        cached = self.entries.get(key)
+        if cached is not None:
+            expires_at, entry = cached
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+            else:
+                del self.entries[key]
+                entry = None
+
+        if entry is None and self.persistent_tier is not None:
+            try:
+                entry = await self.persistent_tier.get(key)
+            except Exception as e:
+                logger.error(f"LLM cache lookup failed: {e}")
+            if entry is not None:
+                self._remember(key, entry)
+                metrics.increment("llm_cache.persistent_hits")
+
+        if entry is None:
+            metrics.increment("llm_cache.misses")
+            metrics.observe("llm_cache.hit_ratio", 0)
+            return None
+
+        metrics.increment("llm_cache.exact_hits" if entry["exact"] == exact else "llm_cache.normalized_hits")
+        metrics.observe("llm_cache.hit_ratio", 1)
+        return entry["response"]
+
+    async def set(
+        self, api_key: str, model: str, temperature: float, messages: List[Dict[str, str]], response: str
+    ):
+        """Cache a response of an API key"""
+        key, exact = self.make_keys(api_key, model, temperature, messages)
+        entry = {"response": response, "exact": exact}
+        self._remember(key, entry)
+
+        if self.persistent_tier is not None:
+            try:
+                await self.persistent_tier.set(key, entry, self.ttl)
+            except Exception as e:
+                logger.error(f"LLM cache write failed: {e}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self.entries[key] = (time.monotonic() + self.ttl, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+llm_response_cache = LLMResponseCache(
+    settings.llm_cache_size,
+    settings.llm_cache_ttl,
+    settings.llm_cache_backend
+)
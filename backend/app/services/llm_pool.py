@@ -0,0 +1,62 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.llm_providers import get_provider
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMClientPool:
+    """Process-wide LRU of chat model clients of the configured LLM provider
+
+    Clients are shared by every request of the process, so each one keeps
+    its HTTP keep-alive connections to the provider warm between calls.
+    Entries are keyed by a hash of the API key, never the key itself. The
+    shared instances must not be mutated; per-call generation parameters
+    are passed with ``bind`` instead.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._clients: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(api_key: str, model: str) -> Tuple[str, str]:
+        return hashlib.sha256((api_key or "").encode()).hexdigest(), model
+
+    def get(self, api_key: str, model: str):
+        """Get the shared client of an API key and model, creating it on a miss"""
+        key = self._key(api_key, model)
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                metrics.increment("llm_pool.hits")
+                return client
+
+        client = get_provider().create_chat_model(api_key, model)
+
+        with self._lock:
+            # Another thread may have created the same client meanwhile
+            existing = self._clients.get(key)
+            if existing is not None:
+                metrics.increment("llm_pool.hits")
+                return existing
+
+            metrics.increment("llm_pool.misses")
+            self._clients[key] = client
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                metrics.increment("llm_pool.evictions")
+
+        return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+llm_client_pool = LLMClientPool(settings.llm_client_pool_size)
@@ -0,0 +1,187 @@
+import abc
+import asyncio
+import hashlib
+import math
+import random
+from typing import Dict, Any, AsyncIterator, List, Optional
+from langchain.schema import AIMessage, BaseMessage
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMProvider(abc.ABC):
+    """Creates the chat models behind LangChainService.get_chat_model
+
+    A chat model has to support ``bind(temperature=...)``, ``ainvoke`` and
+    ``astream`` on a list of LangChain messages.
+    """
+
+    name = ""
+
+    @abc.abstractmethod
+    def create_chat_model(self, api_key: str, model: str):
+        """Create a chat model of an API key and model"""
+
+    async def close(self):
+        """Release the connections of the provider"""
+
+class OpenAIProvider(LLMProvider):
+    """Creates ChatOpenAI models that share one pool of keep-alive connections
+
+    Every model of every API key sends its requests through the same
+    ``httpx.AsyncClient``, so switching models does not open new connections.
+    """
+
+    name = "openai"
+
+    def __init__(self):
+        self.http_client = None
+
+    def _get_http_client(self):
+        if self.http_client is None:
+            import httpx
+
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.llm_max_connections,
+                    max_keepalive_connections=settings.llm_max_keepalive_connections
+                )
+            )
+        return self.http_client
+
+    def create_chat_model(self, api_key: str, model: str):
+        import openai
+        from langchain_openai import ChatOpenAI
+
+        # Rate limited and failed calls are retried by the rate limiter,
+        # which needs to see every 429 to adapt its concurrency. The async
+        # client is passed in, since ChatOpenAI would hand ``http_client`` to
+        # its sync client too, which cannot use an AsyncClient.
+        async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=self._get_http_client()
+        ).chat.completions
+        return ChatOpenAI(
+            openai_api_key=api_key,
+            model=model,
+            max_retries=0,
+            async_client=async_client
+        )
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+class _FakeResponse:
+    def __init__(self, headers: Dict[str, str]):
+        self.status_code = 429
+        self.headers = headers
+
+class FakeRateLimitError(Exception):
+    """429 of the fake provider, shaped like the OpenAI client's error"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit reached (fake provider)")
+        self.response = _FakeResponse({"retry-after-ms": str(int(retry_after * 1000))})
+
+class FakeTimeoutError(TimeoutError):
+    """Request timeout of the fake provider"""
+
+_WORDS = (
+    "the workflow node result data input output value process step model "
+    "response request token stream cache graph agent task user system"
+).split()
+
+class FakeChatModel:
+    """Chat model that answers locally, without network access
+
+    The response to a prompt is derived from the prompt and the seed, so it
+    is the same on every call. Latency follows a log-normal distribution
+    around ``FAKE_LLM_LATENCY_MS``; streamed responses spend it before the
+    first token and then ``FAKE_LLM_TOKEN_MS`` per token. A share of the
+    calls fails with 429s or timeouts as configured.
+    """
+
+    def __init__(self, model: str, options: Dict[str, Any], rng: random.Random):
+        self.model = model
+        self.options = options
+        self.rng = rng
+
+    def bind(self, **kwargs) -> "FakeChatModel":
+        return FakeChatModel(self.model, {**self.options, **kwargs}, self.rng)
+
+    def _respond(self, messages: List[BaseMessage]) -> List[str]:
+        seed_material = "\x00".join(
+            [str(settings.fake_llm_seed), self.model, str(self.options.get("temperature"))]
+            + [str(message.content) for message in messages]
+        )
+        seed = int.from_bytes(hashlib.sha256(seed_material.encode()).digest()[:8], "big")
+        words = random.Random(seed)
+        return [
+            (" " if i else "") + words.choice(_WORDS)
+            for i in range(settings.fake_llm_response_tokens)
+        ]
+
+    async def _wait_for_response(self):
+        """Sleep for the first-token latency, failing the call if it was picked to fail"""
+        roll = self.rng.random()
+        if roll < settings.fake_llm_rate_limit_rate:
+            await asyncio.sleep(0.005)
+            raise FakeRateLimitError(settings.fake_llm_retry_after)
+        if roll < settings.fake_llm_rate_limit_rate + settings.fake_llm_timeout_rate:
+            await asyncio.sleep(settings.fake_llm_timeout_seconds)
+            raise FakeTimeoutError("Request timed out (fake provider)")
+
+        median = settings.fake_llm_latency_ms / 1000
+        await asyncio.sleep(median * math.exp(self.rng.gauss(0, settings.fake_llm_latency_sigma)))
+
+    async def ainvoke(self, messages: List[BaseMessage], *args, **kwargs) -> AIMessage:
+        await self._wait_for_response()
+        tokens = self._respond(messages)
+        await asyncio.sleep(len(tokens) * settings.fake_llm_token_ms / 1000)
+        return AIMessage(content="".join(tokens))
+
+    async def astream(self, messages: List[BaseMessage], *args, **kwargs) -> AsyncIterator[AIMessage]:
+        await self._wait_for_response()
+        for token in self._respond(messages):
+            yield AIMessage(content=token)
+            await asyncio.sleep(settings.fake_llm_token_ms / 1000)
+
+class FakeProvider(LLMProvider):
+    """Local provider for load tests and CI; see FakeChatModel"""
+
+    name = "fake"
+
+    def __init__(self):
+        # Latencies and injected errors draw from one seeded sequence, so a
+        # run with the same calls in the same order behaves the same
+        self.rng = random.Random(settings.fake_llm_seed)
+
+    def create_chat_model(self, api_key: str, model: str) -> FakeChatModel:
+        return FakeChatModel(model, {}, self.rng)
+
+PROVIDERS = {provider.name: provider for provider in (OpenAIProvider, FakeProvider)}
+
+_provider: Optional[LLMProvider] = None
+
+def get_provider() -> LLMProvider:
+    """Get the provider selected with LLM_PROVIDER"""
+    global _provider
+    if _provider is None:
+        if settings.llm_provider not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {settings.llm_provider}")
+        _provider = PROVIDERS[settings.llm_provider]()
+        logger.info(f"Using LLM provider {settings.llm_provider}")
+    return _provider
+
+async def close_provider():
+    """Close the provider, if one was created"""
+    global _provider
+    if _provider is not None:
+        await _provider.close()
+        _provider = None
@@ -0,0 +1,143 @@
+import json
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.prompt_template import count_tokens
+from app.services.scheduler import current_step
+import logging
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K prompt and completion tokens; LLM_MODEL_PRICES adds or overrides
+# entries. Models are matched by their longest listed prefix.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+if settings.llm_model_prices:
+    MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(settings.llm_model_prices).items()})
+
+_TOTAL_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "total_tokens", "latency_ms", "cost")
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimate the USD cost of a call, 0 for models without a price"""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+def message_usage(message: Any, prompt: str) -> Tuple[int, int]:
+    """Get the prompt and completion tokens of a response
+
+    Counts reported by the provider are used when the response carries
+    them; otherwise both are counted locally.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+    return count_tokens(prompt), count_tokens(str(message.content))
+
+def record_llm_call(model: str, prompt_tokens: int, completion_tokens: int, latency_ms: float):
+    """Add an LLM call to the usage of the node running in the current task"""
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+
+    metrics.increment("llm.calls")
+    metrics.increment("llm.prompt_tokens", prompt_tokens)
+    metrics.increment("llm.completion_tokens", completion_tokens)
+    metrics.increment("llm.cost", cost)
+    metrics.observe("llm.latency_ms", latency_ms)
+
+    step = current_step.get(None)
+    if step is None:
+        return
+
+    usage = step.get("llm_usage")
+    if usage is None:
+        usage = step["llm_usage"] = {"models": [], **{field: 0 for field in _TOTAL_FIELDS}}
+    if model not in usage["models"]:
+        usage["models"].append(model)
+    usage["calls"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    usage["total_tokens"] += prompt_tokens + completion_tokens
+    usage["latency_ms"] += latency_ms
+    usage["cost"] += cost
+
+class UsageTotals:
+    """Roll-up of the LLM usage of the steps of one execution"""
+
+    def __init__(self):
+        self.totals = {field: 0 for field in _TOTAL_FIELDS}
+
+    def add(self, step: Dict[str, Any]):
+        usage = step.get("llm_usage")
+        if usage:
+            for field in _TOTAL_FIELDS:
+                self.totals[field] += usage[field]
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Get the totals, or None if no step called an LLM"""
+        return dict(self.totals) if self.totals["calls"] else None
+
+def rollup_usage(steps: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Sum the LLM usage of execution steps"""
+    totals = UsageTotals()
+    for step in steps:
+        totals.add(step)
+    return totals.result()
+
+def usage_summary_pipelines(match: Dict[str, Any], sort_by: str, limit: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Get the aggregation pipelines of the top workflows and nodes"""
+    sort_field = "total_tokens" if sort_by == "tokens" else "duration_ms"
+
+    workflows = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$workflow_id",
+            "executions": {"$sum": 1},
+            "llm_calls": {"$sum": {"$ifNull": ["$llm_usage.calls", 0]}},
+            "total_tokens": {"$sum": {"$ifNull": ["$llm_usage.total_tokens", 0]}},
+            "cost": {"$sum": {"$ifNull": ["$llm_usage.cost", 0]}},
+            "llm_latency_ms": {"$sum": {"$ifNull": ["$llm_usage.latency_ms", 0]}},
+            "duration_ms": {"$sum": {"$subtract": [{"$ifNull": ["$updated_at", "$created_at"]}, "$created_at"]}}
+        }},
+        {"$sort": {sort_field: -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "workflow_id": "$_id", "executions": 1, "llm_calls": 1, "total_tokens": 1,
+                      "cost": 1, "llm_latency_ms": 1, "duration_ms": 1}}
+    ]
+
+    nodes = [
+        {"$match": match},
+        {"$unwind": "$steps"},
+        # Steps carried over from the execution a resume started from ran there, not here
+        {"$match": {"steps.carried_over": {"$ne": True}}},
+        {"$group": {
+            "_id": {"workflow_id": "$workflow_id", "node_id": "$steps.node_id", "node_type": "$steps.node_type"},
+            "runs": {"$sum": 1},
+            "llm_calls": {"$sum": {"$ifNull": ["$steps.llm_usage.calls", 0]}},
+            "total_tokens": {"$sum": {"$ifNull": ["$steps.llm_usage.total_tokens", 0]}},
+            "cost": {"$sum": {"$ifNull": ["$steps.llm_usage.cost", 0]}},
+            "llm_latency_ms": {"$sum": {"$ifNull": ["$steps.llm_usage.latency_ms", 0]}},
+            "duration_ms": {"$sum": {"$subtract": [
+                {"$ifNull": ["$steps.completed_at", "$steps.started_at"]}, "$steps.started_at"
+            ]}}
+        }},
+        {"$sort": {sort_field: -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "workflow_id": "$_id.workflow_id", "node_id": "$_id.node_id",
+                      "node_type": "$_id.node_type", "runs": 1, "llm_calls": 1, "total_tokens": 1,
+                      "cost": 1, "llm_latency_ms": 1, "duration_ms": 1}}
+    ]
+
+    return workflows, nodes
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Mapping, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MongoCacheTier:
+    """Shared cache tier stored in the node_result_cache collection
+
+    Expiry is enforced on read and by a TTL index on ``expires_at``.
+    """
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await get_database().node_result_cache.find_one({"_id": key})
+        if not entry or entry["expires_at"] < datetime.utcnow():
+            return None
+        return {"result": entry["result"], "duration_ms": entry["duration_ms"]}
+
+    async def set(self, key: str, entry: Dict[str, Any], ttl: float):
+        await get_database().node_result_cache.update_one(
+            {"_id": key},
+            {"$set": {**entry, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+class SQLiteCacheTier:
+    """Local cache tier stored in a SQLite file
+
+    With ``max_entries`` set, the entries closest to expiry are evicted
+    once the table grows beyond it. Statements run in worker threads, so
+    the one connection is only used while holding a lock.
+    """
+
+    def __init__(self, path: str, table: str = "node_result_cache", max_entries: int = 0):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at ON {self.table} (expires_at)"
+            )
+        return self._connection
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT entry FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, entry: Dict[str, Any], ttl: float):
+        data = json.dumps(entry, default=str)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, entry, expires_at) VALUES (?, ?, ?)",
+                    (key, data, time.time() + ttl)
+                )
+                connection.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+                if self.max_entries > 0:
+                    connection.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                        f"ORDER BY expires_at LIMIT max((SELECT count(*) FROM {self.table}) - ?, 0))",
+                        (self.max_entries,)
+                    )
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, entry: Dict[str, Any], ttl: float):
+        await asyncio.to_thread(self._set, key, entry, ttl)
+
+class NodeResultCache:
+    """Content-addressed cache of node results
+
+    Results are keyed by a stable hash of the node type, its config and its
+    input. Lookups go through a bounded in-memory LRU tier first and then an
+    optional persistent tier (``NODE_CACHE_BACKEND`` of ``mongo`` or
+    ``sqlite``). Node types listed in ``NODE_CACHE_TYPES`` are cached by
+    default; a node's ``cache`` config flag opts it in or out explicitly.
+    The memory tier is bounded by entry count and by the serialized size of
+    its entries, and results over ``NODE_CACHE_MAX_ENTRY_BYTES`` are not
+    cached at all.
+    """
+
+    def __init__(self, max_size: int, ttl: float, backend: str = "memory"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = settings.node_cache_max_bytes
+        self.max_entry_bytes = settings.node_cache_max_entry_bytes
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.enabled_types = {t.strip() for t in settings.node_cache_types.split(",") if t.strip()}
+
+        if backend == "mongo":
+            self.persistent_tier = MongoCacheTier()
+        elif backend == "sqlite":
+            self.persistent_tier = SQLiteCacheTier(settings.node_cache_sqlite_path)
+        else:
+            self.persistent_tier = None
+
+    def is_enabled(self, node_type: str, config: Dict[str, Any]) -> bool:
+        """Check whether results of a node may be served from the cache"""
+        if self.max_size <= 0:
+            return False
+        if "cache" in config:
+            return bool(config["cache"])
+        return node_type in self.enabled_types
+
+    @staticmethod
+    def make_key(node_type: str, config: Dict[str, Any], input_data: Mapping[str, Any]) -> str:
+        """Get the content address of a node invocation"""
+        payload = json.dumps(
+            {"type": node_type, "config": config, "input": dict(input_data)},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached entry with the node result and its original duration"""
+        cached = self.entries.get(key)
+        if cached is not None:
+            expires_at, entry, _ = cached
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                metrics.increment("node_cache.memory_hits")
+                return entry
+            self._forget(key)
+
+        if self.persistent_tier is not None:
+            try:
+                entry = await self.persistent_tier.get(key)
+            except Exception as e:
+                logger.error(f"Node cache lookup failed: {e}")
+                entry = None
+            if entry is not None:
+                self._remember(key, entry, self._size(entry))
+                metrics.increment("node_cache.persistent_hits")
+                return entry
+
+        metrics.increment("node_cache.misses")
+        return None
+
+    async def set(self, key: str, result: Dict[str, Any], duration_ms: float):
+        """Cache a node result"""
+        entry = {"result": result, "duration_ms": duration_ms}
+        size = self._size(entry)
+        if size > self.max_entry_bytes > 0:
+            metrics.increment("node_cache.too_large")
+            return
+        self._remember(key, entry, size)
+
+        if self.persistent_tier is not None:
+            try:
+                await self.persistent_tier.set(key, entry, self.ttl)
+            except Exception as e:
+                logger.error(f"Node cache write failed: {e}")
+
+    @staticmethod
+    def _size(entry: Dict[str, Any]) -> int:
+        return len(json.dumps(entry, separators=(",", ":"), default=str))
+
+    def _forget(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def _remember(self, key: str, entry: Dict[str, Any], size: int):
+        if key in self.entries:
+            self._forget(key)
+        self.entries[key] = (time.monotonic() + self.ttl, entry, size)
+        self.bytes += size
+        while self.entries and (
+            len(self.entries) > self.max_size or (self.max_bytes > 0 and self.bytes > self.max_bytes)
+        ):
+            self._forget(next(iter(self.entries)))
+
+node_result_cache = NodeResultCache(
+    settings.node_cache_size,
+    settings.node_cache_ttl,
+    settings.node_cache_backend
+)
@@ -1,13 +1,17 @@
-from typing import Dict, Any, List
-import importlib.util
-import tempfile
-import os
+from typing import Dict, Any, List, Set
+import asyncio
 from app.database import get_database
+from app.services.environments import EnvironmentBuildError, environment_manager, normalize_requirements
+from app.services.sandbox import SandboxError, run_custom_code
+from datetime import datetime
 from bson import ObjectId
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The event loop only keeps weak references to tasks
+_environment_builds: Set[asyncio.Task] = set()
+
 class NodeService:
     @staticmethod
     def get_available_node_types():
@@ -173,6 +177,15 @@ class NodeService:
                         "expression": {
                             "type": "string",
                             "description": "Transformation expression"
+                        },
+                        "field": {
+                            "type": "string",
+                            "description": "Input field with the list of records",
+                            "default": "items"
+                        },
+                        "descending": {
+                            "type": "boolean",
+                            "default": False
                         }
                     },
                     "required": ["transformation", "expression"]
@@ -196,24 +209,43 @@ class NodeService:
         except SyntaxError as e:
             raise ValueError(f"Invalid Python syntax: {e}")
         
+        requirements = normalize_requirements(node_data.get("requirements", []))
+        
         # Save custom node to database
         custom_node = {
             "user_id": ObjectId(user_id),
             "name": node_data.get("name"),
             "description": node_data.get("description"),
             "code": code,
-            "requirements": node_data.get("requirements", []),
+            "requirements": requirements,
             "config_schema": node_data.get("config_schema", {}),
             "created_at": datetime.utcnow()
         }
         
         result = await db.custom_nodes.insert_one(custom_node)
         
+        # Build the environment now, so the first execution does not wait for it
+        if requirements:
+            NodeService._prepare_environment(requirements)
+        
         return {
             "id": str(result.inserted_id),
             "message": "Custom node created successfully"
         }
 
+    @staticmethod
+    def _prepare_environment(requirements: List[str]):
+        """Build an environment in the background, keeping a reference to the task until it is done"""
+        task = asyncio.create_task(environment_manager.ensure(requirements))
+        _environment_builds.add(task)
+
+        def _done(task: asyncio.Task):
+            _environment_builds.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Failed to build environment for {', '.join(requirements)}: {task.exception()}")
+
+        task.add_done_callback(_done)
+
     @staticmethod
     async def get_user_custom_nodes(user_id: str):
         """Get user's custom nodes"""
@@ -267,27 +299,11 @@ class NodeService:
         if not node:
             raise ValueError("Custom node not found")
         
-        # Create a temporary file with the code
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(node["code"])
-            temp_file = f.name
-        
+        # Run the code in a sandbox worker of its requirements environment,
+        # which keeps the compiled module for the next call with the same code
         try:
-            # Load and execute the module
-            spec = importlib.util.spec_from_file_location("custom_node", temp_file)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            
-            # Execute the main function
-            if hasattr(module, 'execute'):
-                result = module.execute(input_data)
-                return {"success": True, "output": result}
-            else:
-                raise ValueError("Custom node must have an 'execute' function")
-                
-        except Exception as e:
+            result = await run_custom_code(node["code"], input_data, node.get("requirements", []))
+            return {"success": True, "output": result}
+        except (SandboxError, EnvironmentBuildError) as e:
             logger.error(f"Error executing custom node: {e}")
             return {"success": False, "error": str(e)}
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_file)
\ No newline at end of file
@@ -0,0 +1,184 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, List, Mapping, Optional, Tuple, Union
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # Without tiktoken tokens are estimated at four characters each
+    _encoding = None
+
+Summarizer = Callable[[str, int], Awaitable[str]]
+
+OVERFLOW_STRATEGIES = ("truncate", "truncate_middle", "summarize", "error")
+
+_PLACEHOLDER = re.compile(r"\{\{|\}\}|\{([^{}]*)\}")
+_ELLIPSIS = " [...] "
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    """Keep the first tokens of a text"""
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:tokens])
+    return text[:tokens * 4]
+
+def _tail(text: str, tokens: int) -> str:
+    if tokens <= 0:
+        return ""
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[-tokens:])
+    return text[-tokens * 4:]
+
+def _render_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, Mapping):
+        value = dict(value)
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+def _allocate(sizes: List[int], available: int) -> List[int]:
+    """Split a token budget over fields, giving small fields all they need first"""
+    allowances = [0] * len(sizes)
+    remaining = available
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        index = pending.pop(0)
+        allowances[index] = min(sizes[index], share)
+        remaining -= allowances[index]
+    return allowances
+
+class RenderedPrompt:
+    __slots__ = ("text", "tokens", "truncated")
+
+    def __init__(self, text: str, tokens: int, truncated: bool):
+        self.text = text
+        self.tokens = tokens
+        self.truncated = truncated
+
+class PromptTemplate:
+    """Prompt with placeholders for fields of the execution context
+
+    ``{message}`` inserts a top-level field, ``{node_1.items.0.name}`` walks
+    into nested objects and lists, and ``{input}`` inserts the whole context.
+    Objects are inserted as JSON, missing fields as nothing, and ``{{`` and
+    ``}}`` are literal braces.
+
+    With a token budget, the inserted fields share what the literal text
+    leaves over: fields that fit their share are kept whole and longer ones
+    are shortened with the overflow strategy, so prompts stay bounded no
+    matter how much context the workflow has accumulated.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.parts: List[Union[str, Tuple[str, ...]]] = []
+
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            self.parts.append(source[position:match.start()])
+            token = match.group(0)
+            if token in ("{{", "}}"):
+                self.parts.append(token[0])
+            else:
+                path = match.group(1).strip()
+                self.parts.append(tuple(path.split(".")) if path else ("input",))
+            position = match.end()
+        self.parts.append(source[position:])
+
+        self.parts = [part for part in self.parts if part != ""]
+        self.literal_tokens = sum(count_tokens(part) for part in self.parts if isinstance(part, str))
+
+    @staticmethod
+    def resolve(path: Tuple[str, ...], context: Mapping[str, Any]) -> Any:
+        """Get the value of a field path, or None if it does not exist"""
+        if path == ("input",) and "input" not in context:
+            return context
+
+        value: Any = context
+        for key in path:
+            if isinstance(value, Mapping):
+                value = value.get(key)
+            elif isinstance(value, (list, tuple)) and key.lstrip("-").isdigit():
+                index = int(key)
+                value = value[index] if -len(value) <= index < len(value) else None
+            else:
+                return None
+            if value is None:
+                return None
+        return value
+
+    async def render(
+        self,
+        context: Mapping[str, Any],
+        budget: int = 0,
+        overflow: str = "truncate",
+        summarize: Optional[Summarizer] = None
+    ) -> RenderedPrompt:
+        """Render the prompt, keeping it within the token budget if one is given"""
+        fields = [
+            (index, _render_value(self.resolve(part, context)))
+            for index, part in enumerate(self.parts)
+            if isinstance(part, tuple)
+        ]
+        sizes = [count_tokens(text) for _, text in fields]
+        values = {index: text for index, text in fields}
+        truncated = False
+
+        if budget > 0 and self.literal_tokens + sum(sizes) > budget:
+            if overflow == "error":
+                raise ValueError(f"Prompt needs {self.literal_tokens + sum(sizes)} tokens, over its budget of {budget}")
+
+            allowances = _allocate(sizes, max(0, budget - self.literal_tokens))
+            for (index, text), size, allowance in zip(fields, sizes, allowances):
+                if size > allowance:
+                    values[index] = await self._shorten(text, allowance, overflow, summarize)
+                    truncated = True
+            metrics.increment("prompt.truncated")
+
+        text = "".join(
+            values[index] if isinstance(part, tuple) else part
+            for index, part in enumerate(self.parts)
+        )
+        tokens = count_tokens(text)
+        metrics.observe("prompt.tokens", tokens)
+        return RenderedPrompt(text, tokens, truncated)
+
+    @staticmethod
+    async def _shorten(text: str, tokens: int, overflow: str, summarize: Optional[Summarizer]) -> str:
+        if tokens <= 0:
+            return ""
+
+        if overflow == "summarize" and summarize is not None:
+            try:
+                text = await summarize(text, tokens)
+                metrics.increment("prompt.summarized")
+            except Exception as e:
+                logger.error(f"Prompt field summarization failed, truncating instead: {e}")
+            if count_tokens(text) <= tokens:
+                return text
+
+        if overflow == "truncate_middle":
+            half = max(0, tokens - count_tokens(_ELLIPSIS)) // 2
+            return truncate_tokens(text, half) + _ELLIPSIS + _tail(text, half)
+        return truncate_tokens(text, tokens)
+
+@lru_cache(maxsize=1024)
+def compile_template(source: str) -> PromptTemplate:
+    """Get the compiled form of a prompt template"""
+    return PromptTemplate(source)
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from contextvars import ContextVar
+from typing import Dict, Awaitable, Callable, Optional, Tuple, TypeVar
+from app.core.config import settings
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """Continuously refilled budget of a per-minute quota"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Get the seconds until the given amount is available"""
+        self._refill()
+        # Requests larger than the whole bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        """Take an amount from the bucket, or give it back when negative"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+class _Usage:
+    __slots__ = ("tokens",)
+
+    def __init__(self):
+        self.tokens: Optional[int] = None
+
+# Usage of the provider call running in the current task
+_current_usage: ContextVar[Optional[_Usage]] = ContextVar("provider_usage", default=None)
+
+def report_tokens(tokens: int):
+    """Report the tokens the provider counted for the call running in the current task"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.tokens = tokens
+
+def error_status(error: BaseException) -> Optional[int]:
+    """Get the HTTP status of a provider error, if it has one"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Get the delay a provider asked for in its Retry-After headers"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class ProviderLimiter:
+    """Admission control for the calls of one API key and model
+
+    Calls are admitted in arrival order once the request and token buckets
+    allow them and fewer than ``limit`` calls are in flight. The limit grows
+    by one for every ``limit`` successful calls and is halved on every 429
+    (AIMD), so it settles just below what the provider accepts. A burst of
+    429s for calls that were admitted together halves it only once. A 429
+    also pauses admission for the Retry-After the provider asked for.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(settings.llm_initial_concurrency)
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self._admission = asyncio.Lock()
+        self._slot_freed = asyncio.Event()
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """Wait until a call may be sent and return when it was admitted"""
+        async with self._admission:
+            while True:
+                while self.inflight >= int(self.limit):
+                    self._slot_freed.clear()
+                    await self._slot_freed.wait()
+
+                delay = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.inflight += 1
+            return time.monotonic()
+
+    def is_queueing(self) -> bool:
+        """Check whether calls are waiting for admission or all slots are taken"""
+        return self._admission.locked() or self.inflight >= int(self.limit)
+
+    def reconcile(self, estimated_tokens: int, tokens: int):
+        """Charge or refund the difference between the estimated and counted tokens of a call"""
+        self.tokens.take(tokens - estimated_tokens)
+        metrics.observe("llm_rate_limiter.estimate_error_tokens", tokens - estimated_tokens)
+
+    def release(self, admitted_at: float, outcome: str = "completed", delay: Optional[float] = None):
+        """Finish a call and adapt the concurrency limit to its outcome
+
+        ``outcome`` is ``completed``, ``rate_limited`` or ``failed``.
+        """
+        self.inflight -= 1
+        if outcome == "rate_limited":
+            now = time.monotonic()
+            if admitted_at > self.decreased_at:
+                self.limit = max(1.0, self.limit / 2)
+                self.decreased_at = now
+            self.paused_until = max(self.paused_until, now + (delay or 1.0))
+        elif outcome == "completed":
+            self.limit = min(float(settings.llm_max_concurrency), self.limit + 1 / self.limit)
+        metrics.observe("llm_rate_limiter.concurrency_limit", self.limit)
+        self._slot_freed.set()
+
+class LLMRateLimiter:
+    """Provider limiters for every API key and model used in this process"""
+
+    def __init__(self):
+        self.limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+        self.model_limits: Dict[str, Dict[str, float]] = (
+            json.loads(settings.llm_model_rate_limits) if settings.llm_model_rate_limits else {}
+        )
+
+    def get(self, api_key: str, model: str) -> ProviderLimiter:
+        """Get the limiter of an API key and model"""
+        key = (hashlib.sha256((api_key or "").encode()).hexdigest(), model)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limits = self.model_limits.get(model, {})
+            limiter = self.limiters[key] = ProviderLimiter(
+                limits.get("rpm", settings.llm_requests_per_minute),
+                limits.get("tpm", settings.llm_tokens_per_minute)
+            )
+        return limiter
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Estimate the tokens a call uses from its prompt text"""
+        return len(text) // 4 + settings.llm_completion_tokens_estimate
+
+    async def run(self, api_key: str, model: str, prompt: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Run a provider call within the limits of its API key and model
+
+        Rate limited and server-side failed calls are queued again and
+        retried up to ``LLM_MAX_RETRIES`` times instead of failing. Calls are
+        admitted on an estimate of their tokens; once a call reports what the
+        provider counted with ``report_tokens``, the difference is charged
+        or refunded.
+        """
+        limiter = self.get(api_key, model)
+        estimated_tokens = self.estimate_tokens(prompt)
+
+        for attempt in range(settings.llm_max_retries + 1):
+            queued_at = time.perf_counter()
+            admitted_at = await limiter.acquire(estimated_tokens)
+            metrics.observe("llm_rate_limiter.queued_seconds", time.perf_counter() - queued_at)
+
+            usage = _Usage()
+            reset = _current_usage.set(usage)
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                limiter.release(admitted_at, "failed")
+                raise
+            except Exception as e:
+                status = error_status(e)
+                if status == 429:
+                    metrics.increment("llm_rate_limiter.rate_limited")
+                    limiter.release(admitted_at, "rate_limited", retry_after(e))
+                else:
+                    limiter.release(admitted_at, "failed")
+
+                retryable = status == 429 or (status is not None and status >= 500)
+                if not retryable or attempt == settings.llm_max_retries:
+                    raise
+
+                if status == 429:
+                    logger.warning(f"Rate limited by provider for {model}, retrying")
+                else:
+                    metrics.increment("llm_rate_limiter.server_errors")
+                    await asyncio.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.0))
+                continue
+            finally:
+                _current_usage.reset(reset)
+                if usage.tokens is not None:
+                    limiter.reconcile(estimated_tokens, usage.tokens)
+
+            limiter.release(admitted_at)
+            return result
+
+llm_rate_limiter = LLMRateLimiter()
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+from multiprocessing.connection import Connection
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.environments import environment_manager
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SandboxError(Exception):
+    """Custom code that was disabled, failed, timed out or exceeded its limits in a sandbox worker"""
+
+# Runs as a script, so the worker imports nothing of the app
+_RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_runtime.py")
+
+def _worker_environment() -> Dict[str, str]:
+    """Get the environment of a sandbox worker, without any secret of the app"""
+    return {"PATH": os.defpath, "LANG": "C.UTF-8"}
+
+class _SandboxHandle:
+    """Parent side of a sandbox worker"""
+
+    def __init__(self, process, conn: Connection):
+        self.process = process
+        self.conn = conn
+        self.modules: "OrderedDict[str, None]" = OrderedDict()
+        self.calls = 0
+        self.future: Optional[asyncio.Future] = None
+        self.alive = True
+
+class SandboxPool:
+    """Run custom node code in warm, resource limited child processes
+
+    Workers are started on first use and each runs one call at a time, so
+    custom code never blocks the event loop of the API or execution process.
+    A worker that exceeds its wall-clock timeout is killed and replaced;
+    one that hits its CPU or memory limit is replaced after reporting it.
+
+    Workers start from a scrubbed environment, without network access and,
+    when the app runs as root, as ``SANDBOX_USER``.
+    """
+
+    def __init__(self, environment: Optional[str] = None):
+        self.environment = environment
+        self.workers: List[_SandboxHandle] = []
+        self.idle: Optional[asyncio.Queue] = None
+        self.running = False
+
+    def start(self, size: int):
+        """Start the worker processes"""
+        self.idle = asyncio.Queue()
+        for _ in range(max(1, size)):
+            self.idle.put_nowait(self._spawn())
+        self.running = True
+        logger.info(f"Started {max(1, size)} sandbox worker processes for {self.environment or 'the default environment'}")
+
+    def _spawn(self) -> _SandboxHandle:
+        parent_sock, child_sock = socket.socketpair()
+        limits = {
+            "environment": self.environment,
+            "user": settings.sandbox_user,
+            "cpu_seconds": settings.sandbox_cpu_seconds,
+            "memory_mb": settings.sandbox_memory_mb,
+            "module_cache_size": settings.sandbox_module_cache_size
+        }
+        process = subprocess.Popen(
+            [sys.executable, "-I", _RUNTIME, str(child_sock.fileno()), json.dumps(limits)],
+            env=_worker_environment(),
+            pass_fds=(child_sock.fileno(),),
+            stdin=subprocess.DEVNULL
+        )
+        child_sock.close()
+
+        parent_conn = Connection(parent_sock.detach())
+        handle = _SandboxHandle(process, parent_conn)
+        self.workers.append(handle)
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_readable, handle)
+        return handle
+
+    def _on_readable(self, handle: _SandboxHandle):
+        try:
+            while handle.conn.poll():
+                _, ok, payload, recycle = handle.conn.recv()
+                if recycle:
+                    handle.alive = False
+                if handle.future is not None and not handle.future.done():
+                    handle.future.set_result((ok, payload))
+        except (EOFError, OSError):
+            self._kill(handle, "Sandbox worker exited unexpectedly")
+
+    def _kill(self, handle: _SandboxHandle, reason: str = "Sandbox worker stopped"):
+        if handle.future is not None and not handle.future.done():
+            handle.future.set_result((False, reason))
+        if handle not in self.workers:
+            return
+        self.workers.remove(handle)
+        handle.alive = False
+        asyncio.get_running_loop().remove_reader(handle.conn.fileno())
+        handle.conn.close()
+        if handle.process.poll() is None:
+            handle.process.kill()
+        self._reap(handle.process)
+
+    def _reap(self, process: subprocess.Popen):
+        """Collect a killed worker without blocking the event loop"""
+        if process.poll() is None:
+            asyncio.get_running_loop().call_later(0.05, self._reap, process)
+
+    async def execute(self, code: str, input_data: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Run the execute function of custom code in a sandbox worker and return its result"""
+        if not self.running:
+            self.start(settings.sandbox_workers)
+
+        code_hash = hashlib.sha256(code.encode()).hexdigest()
+        timeout = timeout or settings.sandbox_timeout
+        handle = await self.idle.get()
+        start = time.perf_counter()
+
+        try:
+            if code_hash in handle.modules:
+                handle.modules.move_to_end(code_hash)
+                metrics.increment("sandbox.module_hits")
+            else:
+                handle.conn.send(("code", code_hash, code))
+                handle.modules[code_hash] = None
+                while len(handle.modules) > settings.sandbox_module_cache_size:
+                    handle.modules.popitem(last=False)
+                metrics.increment("sandbox.module_misses")
+
+            handle.future = asyncio.get_running_loop().create_future()
+            handle.calls += 1
+            handle.conn.send(("run", code_hash, input_data))
+            ok, payload = await asyncio.wait_for(handle.future, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("sandbox.timeouts")
+            self._kill(handle)
+            raise SandboxError(f"Custom code timed out after {timeout}s")
+        except asyncio.CancelledError:
+            # The worker may be stuck in the call, so it cannot be reused
+            self._kill(handle)
+            raise
+        except (EOFError, OSError):
+            self._kill(handle)
+            raise SandboxError("Sandbox worker exited unexpectedly")
+        finally:
+            handle.future = None
+            self._release(handle)
+
+        metrics.increment("sandbox.calls")
+        metrics.observe("sandbox.latency_ms", (time.perf_counter() - start) * 1000)
+        if not ok:
+            raise SandboxError(payload)
+        return payload
+
+    def _release(self, handle: _SandboxHandle):
+        """Return a worker to the idle queue, or a fresh one in place of a spent worker"""
+        spent = settings.sandbox_max_calls > 0 and handle.calls >= settings.sandbox_max_calls
+        if handle.alive and not spent:
+            self.idle.put_nowait(handle)
+            return
+
+        self._kill(handle)
+        if self.running:
+            metrics.increment("sandbox.restarts")
+            self.idle.put_nowait(self._spawn())
+
+    @property
+    def busy(self) -> int:
+        """Number of workers running a call"""
+        return len(self.workers) - self.idle.qsize() if self.running else 0
+
+    def stop(self):
+        """Stop all worker processes"""
+        self.running = False
+        for handle in list(self.workers):
+            try:
+                handle.conn.send(("stop",))
+            except (EOFError, OSError):
+                pass
+            self._kill(handle)
+
+class EnvironmentPools:
+    """Sandbox pools of requirement environments
+
+    Every environment gets its own workers, since a worker cannot unload the
+    packages of one environment to import those of another. Beyond
+    ``SANDBOX_ENVIRONMENT_POOLS``, the least recently used idle pool is stopped.
+    """
+
+    def __init__(self):
+        self.pools: "OrderedDict[str, SandboxPool]" = OrderedDict()
+
+    def get(self, environment: str) -> SandboxPool:
+        pool = self.pools.get(environment)
+        if pool is None:
+            pool = self.pools[environment] = SandboxPool(environment)
+            # Environments with warm workers are not removed from disk
+            environment_manager.active.add(environment)
+        self.pools.move_to_end(environment)
+
+        excess = len(self.pools) - settings.sandbox_environment_pools
+        for key, idle_pool in list(self.pools.items())[:max(0, excess)]:
+            if idle_pool is not pool and idle_pool.busy == 0:
+                idle_pool.stop()
+                del self.pools[key]
+                environment_manager.active.discard(key)
+        return pool
+
+    def stop(self):
+        for pool in self.pools.values():
+            pool.stop()
+        environment_manager.active.difference_update(self.pools)
+        self.pools.clear()
+
+sandbox_pool = SandboxPool()
+environment_pools = EnvironmentPools()
+
+async def run_custom_code(
+    code: str,
+    input_data: Dict[str, Any],
+    requirements: Iterable[str] = (),
+    timeout: Optional[float] = None
+) -> Any:
+    """Run custom code in a sandbox with its requirements installed"""
+    if not settings.custom_code_enabled:
+        raise SandboxError("Custom code is disabled; set CUSTOM_CODE_ENABLED=true to run code and custom nodes")
+    environment = await environment_manager.ensure(requirements)
+    pool = sandbox_pool if environment is None else environment_pools.get(environment)
+    return await pool.execute(code, input_data, timeout)
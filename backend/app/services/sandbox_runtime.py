@@ -0,0 +1,182 @@
+"""
+Child side of a sandbox worker
+
+Run as a script with ``python -I``, so it imports nothing of the app: custom
+code in the worker cannot reach the settings, secrets or database client of
+the process that started it.
+
+Usage: python -I sandbox_runtime.py <fd> <limits json>
+"""
+import asyncio
+import ctypes
+import inspect
+import json
+import os
+import pickle
+import pwd
+import resource
+import signal
+import sys
+import tempfile
+import types
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from multiprocessing.connection import Connection
+
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+
+class _CPULimitExceeded(BaseException):
+    # Not an Exception, so custom code cannot swallow it with ``except Exception``
+    pass
+
+def _on_cpu_limit(signum, frame):
+    raise _CPULimitExceeded()
+
+def _address_space() -> int:
+    """Get the virtual memory size of this process, 0 if it is unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _unshare(flags: int):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(flags) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+def _isolate(user: str):
+    """Cut the process off the network and drop its privileges"""
+    if os.geteuid() == 0:
+        # A network namespace of its own has no interfaces but loopback
+        _unshare(_CLONE_NEWNET)
+        account = pwd.getpwnam(user)
+        os.setgroups([])
+        os.setgid(account.pw_gid)
+        os.setuid(account.pw_uid)
+    else:
+        # Unprivileged processes need a user namespace to get a network namespace
+        _unshare(_CLONE_NEWUSER | _CLONE_NEWNET)
+
+class _SandboxRuntime:
+    """Runs one call at a time
+
+    Modules are kept by code hash in an LRU that the parent mirrors, so code
+    is only sent, compiled and imported the first time a worker runs it.
+    """
+
+    def __init__(self, conn: Connection, limits: Dict[str, Any], failure: Optional[str] = None):
+        self.conn = conn
+        self.limits = limits
+        self.failure = failure
+        self.sources: "OrderedDict[str, str]" = OrderedDict()
+        self.modules: Dict[str, types.ModuleType] = {}
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                return
+
+            kind = message[0]
+            if kind == "code":
+                _, code_hash, source = message
+                self.sources[code_hash] = source
+                while len(self.sources) > self.limits["module_cache_size"]:
+                    evicted, _ = self.sources.popitem(last=False)
+                    self.modules.pop(evicted, None)
+
+            elif kind == "run":
+                _, code_hash, input_data = message
+                self.sources.move_to_end(code_hash)
+                if self.failure is not None:
+                    reply = ("result", False, self.failure, False)
+                else:
+                    try:
+                        reply = self._run(code_hash, input_data)
+                    except _CPULimitExceeded:
+                        # The limit fired after the call returned but before the timer was cleared
+                        reply = ("result", False, self._cpu_limit_message(), True)
+                self._send(reply)
+
+            elif kind == "stop":
+                return
+
+    def _load_module(self, code_hash: str) -> types.ModuleType:
+        module = self.modules.get(code_hash)
+        if module is None:
+            code = compile(self.sources[code_hash], f"<custom node {code_hash[:12]}>", "exec")
+            module = types.ModuleType("custom_node")
+            exec(code, module.__dict__)
+            self.modules[code_hash] = module
+        return module
+
+    def _run(self, code_hash: str, input_data: Dict[str, Any]) -> tuple:
+        """Run the execute function of a module within the CPU time limit"""
+        # ITIMER_PROF counts the CPU time of the process, and unlike
+        # RLIMIT_CPU it can be reset for every call
+        if self.limits["cpu_seconds"] > 0:
+            signal.setitimer(signal.ITIMER_PROF, self.limits["cpu_seconds"])
+        try:
+            module = self._load_module(code_hash)
+            execute = getattr(module, "execute", None)
+            if not callable(execute):
+                raise ValueError("Custom node must have an 'execute' function")
+
+            result = execute(input_data)
+            if inspect.isawaitable(result):
+                result = self.loop.run_until_complete(result)
+            return ("result", True, result, False)
+        except _CPULimitExceeded:
+            # The signal may have interrupted the event loop itself
+            self.loop = asyncio.new_event_loop()
+            return ("result", False, self._cpu_limit_message(), True)
+        except MemoryError:
+            return ("result", False, f"Custom code exceeded its memory limit of {self.limits['memory_mb']} MB", True)
+        except Exception as e:
+            return ("result", False, f"{type(e).__name__}: {e}", False)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def _cpu_limit_message(self) -> str:
+        return f"Custom code exceeded its CPU time limit of {self.limits['cpu_seconds']}s"
+
+    def _send(self, reply: tuple):
+        try:
+            data = pickle.dumps(reply, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            data = pickle.dumps(("result", False, f"Result of custom code cannot be serialized: {e}", False))
+        self.conn.send_bytes(data)
+
+def main(fd: int, limits: Dict[str, Any]):
+    # Interrupts are handled by the parent, which stops its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGPROF, _on_cpu_limit)
+    conn = Connection(fd)
+
+    # Without isolation every call fails, rather than running unconfined
+    failure = None
+    try:
+        _isolate(limits["user"])
+        os.chdir(tempfile.mkdtemp(prefix="sandbox-"))
+    except (OSError, KeyError) as e:
+        failure = f"Sandbox isolation is unavailable: {e}"
+
+    if limits["environment"] is not None:
+        # Packages of the environment take precedence over the default ones
+        sys.path.insert(0, limits["environment"])
+
+    if limits["memory_mb"] > 0:
+        # The limit is on top of what the interpreter already maps, so it
+        # bounds what custom code can allocate
+        limit = _address_space() + limits["memory_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    _SandboxRuntime(conn, limits, failure).run()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]), json.loads(sys.argv[2]))
@@ -0,0 +1,198 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, Any, AsyncGenerator, Awaitable, Callable, List, Optional
+from datetime import datetime
+from app.core.config import settings
+from app.services.execution_context import ExecutionContext
+from app.services.execution_plan import CompiledNode, ExecutionPlan
+import logging
+
+logger = logging.getLogger(__name__)
+
+NodeRunner = Callable[[CompiledNode, ExecutionContext], Awaitable[Dict[str, Any]]]
+
+# Extra fields recorded on the execution step of the node running in the
+# current task, e.g. cache hits
+current_step: ContextVar[Dict[str, Any]] = ContextVar("current_step")
+
+# Receives partial output (e.g. LLM tokens) of the node running in the
+# current task; only set when the scheduler streams tokens
+token_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("token_sink", default=None)
+
+# Settings of the workflow the node running in the current task belongs to
+workflow_settings: ContextVar[Dict[str, Any]] = ContextVar("workflow_settings", default={})
+
+_process_semaphore: Optional[asyncio.Semaphore] = None
+
+def get_process_semaphore() -> asyncio.Semaphore:
+    """Get the process-wide cap on concurrently running nodes"""
+    global _process_semaphore
+    if _process_semaphore is None:
+        _process_semaphore = asyncio.Semaphore(settings.max_process_node_concurrency)
+    return _process_semaphore
+
+class DAGScheduler:
+    """Run the nodes of a compiled plan as soon as all of their upstream nodes have finished"""
+
+    def __init__(
+        self,
+        plan: ExecutionPlan,
+        run_node: NodeRunner,
+        max_concurrency: Optional[int] = None,
+        stream_tokens: bool = False
+    ):
+        self.plan = plan
+        self.run_node = run_node
+        self.max_concurrency = max_concurrency or settings.max_node_concurrency
+        self.stream_tokens = stream_tokens
+
+    def _build_input(
+        self, node: CompiledNode, root: ExecutionContext, layers: List[Optional[ExecutionContext]]
+    ) -> ExecutionContext:
+        """Build the input of a node as a view over its parents' output layers"""
+        if not node.parents:
+            return root
+        return ExecutionContext.merge([layers[parent] for parent in node.parents])
+
+    async def run(
+        self,
+        input_data: Dict[str, Any],
+        completed: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Run all nodes, yielding node_start, node_complete and node_error events
+
+        With ``stream_tokens`` set, partial node output is yielded as
+        node_token events while the node is still running.
+
+        ``completed`` maps node ids to outputs from an earlier run; those nodes
+        are not run again as long as all of their parents completed as well.
+        Nodes time out after their own timeout and the whole run after the
+        plan's timeout. The first failing node cancels everything still in
+        flight and its exception is re-raised after its node_error event has
+        been yielded.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        execution_semaphore = asyncio.Semaphore(self.max_concurrency)
+        process_semaphore = get_process_semaphore()
+
+        nodes = self.plan.nodes
+        remaining = [len(node.parents) for node in nodes]
+        running: Dict[int, asyncio.Task] = {}
+        root = ExecutionContext(input_data)
+        inputs: List[Optional[ExecutionContext]] = [None] * len(nodes)
+        layers: List[Optional[ExecutionContext]] = [None] * len(nodes)
+
+        async def run_one(node: CompiledNode, context: ExecutionContext):
+            async with execution_semaphore, process_semaphore:
+                step = {}
+                current_step.set(step)
+                workflow_settings.set(self.plan.settings)
+                if self.stream_tokens:
+                    token_sink.set(lambda token: events.put_nowait({
+                        "type": "node_token",
+                        "index": node.index,
+                        "node_id": node.id,
+                        "token": token
+                    }))
+                started_at = datetime.utcnow()
+                await events.put({
+                    "type": "node_start",
+                    "index": node.index,
+                    "node_id": node.id,
+                    "node_type": node.type,
+                    "input": context,
+                    "started_at": started_at
+                })
+                try:
+                    result = await asyncio.wait_for(self.run_node(node, context), node.timeout)
+                except asyncio.TimeoutError:
+                    await events.put({
+                        "type": "node_error",
+                        "index": node.index,
+                        "node_id": node.id,
+                        "node_type": node.type,
+                        "input": context,
+                        "error": TimeoutError(f"Node {node.id} timed out after {node.timeout:g}s"),
+                        "step": step,
+                        "started_at": started_at,
+                        "completed_at": datetime.utcnow()
+                    })
+                    return
+                except Exception as e:
+                    await events.put({
+                        "type": "node_error",
+                        "index": node.index,
+                        "node_id": node.id,
+                        "node_type": node.type,
+                        "input": context,
+                        "error": e,
+                        "step": step,
+                        "started_at": started_at,
+                        "completed_at": datetime.utcnow()
+                    })
+                    return
+
+                await events.put({
+                    "type": "node_complete",
+                    "index": node.index,
+                    "node_id": node.id,
+                    "node_type": node.type,
+                    "input": context,
+                    "result": result,
+                    "step": step,
+                    "started_at": started_at,
+                    "completed_at": datetime.utcnow()
+                })
+
+        def launch(node: CompiledNode):
+            context = self._build_input(node, root, layers)
+            inputs[node.index] = context
+            running[node.index] = asyncio.create_task(run_one(node, context))
+
+        completed = completed or {}
+
+        try:
+            for node in nodes:
+                if remaining[node.index] != 0:
+                    continue
+
+                if node.id not in completed:
+                    launch(node)
+                    continue
+
+                # Replay the earlier output; children become ready in turn
+                # because nodes are visited in topological order
+                layers[node.index] = self._build_input(node, root, layers).push(completed[node.id], node.index)
+                for child in node.children:
+                    remaining[child] -= 1
+
+            deadline = asyncio.get_running_loop().time() + self.plan.timeout
+            while running:
+                try:
+                    event = await asyncio.wait_for(
+                        events.get(), deadline - asyncio.get_running_loop().time()
+                    )
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Execution timed out after {self.plan.timeout:g}s")
+                index = event["index"]
+
+                if event["type"] in ("node_start", "node_token"):
+                    yield event
+                    continue
+
+                running.pop(index)
+                yield event
+
+                if event["type"] == "node_error":
+                    raise event["error"]
+
+                layers[index] = inputs[index].push(event["result"], index)
+                for child in nodes[index].children:
+                    remaining[child] -= 1
+                    if remaining[child] == 0:
+                        launch(nodes[child])
+        finally:
+            for task in running.values():
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.values(), return_exceptions=True)
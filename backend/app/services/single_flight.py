@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import json
+from typing import Dict, Any, Awaitable, Callable, TypeVar
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one upstream call
+
+    The first caller of a key starts the call in its own task; callers that
+    arrive with the same key while it is in flight await that task instead
+    of starting another. A caller that is cancelled leaves the call running
+    for the others; only once every caller is gone is it cancelled as well.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[str, _Flight] = {}
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Get the key of a call from its arguments"""
+        payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Run a call, or join the identical one already in flight"""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(call()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+            metrics.increment(f"single_flight.{self.name}.calls")
+        else:
+            metrics.increment(f"single_flight.{self.name}.coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _land(self, key: str, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled():
+            # Retrieve the exception so a flight whose callers all left does not log it as unhandled
+            flight.task.exception()
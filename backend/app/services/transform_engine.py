@@ -0,0 +1,751 @@
+import ast
+import operator
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    # Without NumPy transforms run on Python lists
+    np = None
+
+TRANSFORMATIONS = ("map", "filter", "reduce", "sort")
+
+_MAX_EXPRESSION_LENGTH = 2000
+_MAX_EXPRESSION_NODES = 256
+_MAX_POWER = 64
+# Ints beyond this many bits are rejected, so nested powers and products
+# cannot spend unbounded time and memory on huge numbers
+_MAX_INT_BITS = 4096
+_SEQUENCES = (str, list, tuple)
+
+def _check_int_bits(bits: int):
+    if bits > _MAX_INT_BITS:
+        raise ValueError(f"Numbers in transform expressions are limited to {_MAX_INT_BITS} bits")
+
+def _multiply(a: Any, b: Any) -> Any:
+    # Repeating strings and lists could build arbitrarily large values
+    if isinstance(a, _SEQUENCES) or isinstance(b, _SEQUENCES):
+        raise ValueError("Strings and lists cannot be multiplied in transform expressions")
+    if isinstance(a, int) and isinstance(b, int):
+        _check_int_bits(a.bit_length() + b.bit_length())
+    return a * b
+
+def _modulo(a: Any, b: Any) -> Any:
+    # A width in a format such as "%0999999999d" could build arbitrarily large strings
+    if isinstance(a, _SEQUENCES):
+        raise ValueError("Strings cannot be formatted with % in transform expressions")
+    return a % b
+
+def _power(a: Any, b: Any) -> Any:
+    if isinstance(a, int) and isinstance(b, int) and b > 0:
+        _check_int_bits(a.bit_length() * b)
+    return a ** b
+
+def _zero_safe(fn: Callable) -> Callable:
+    """Wrap an operator to give None instead of raising on a division by zero"""
+    def evaluate(a: Any, b: Any) -> Any:
+        try:
+            return fn(a, b)
+        except ZeroDivisionError:
+            return None
+    evaluate.__name__ = fn.__name__
+    return evaluate
+
+# Both engines give None for a division by zero, rather than raising in one
+# and giving inf or nan in the other. Both branches of ``a if c else b`` are
+# evaluated for every record, so raising would also break guards such as
+# ``price / quantity if quantity else 0``.
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: _zero_safe(operator.truediv),
+    ast.FloorDiv: _zero_safe(operator.floordiv),
+    ast.Mod: _zero_safe(_modulo),
+    ast.Pow: _zero_safe(_power),
+}
+_DIVISION = frozenset(_BINARY[op] for op in (ast.Div, ast.FloorDiv, ast.Mod, ast.Pow))
+# Typed NumPy arrays hold neither strings nor ints beyond int64, so they
+# use the plain operators
+_ARRAY_OPERATORS = {
+    _BINARY[ast.Mult]: operator.mul,
+    _BINARY[ast.Div]: operator.truediv,
+    _BINARY[ast.FloorDiv]: operator.floordiv,
+    _BINARY[ast.Mod]: operator.mod,
+    _BINARY[ast.Pow]: operator.pow,
+}
+_ARITHMETIC = frozenset(_BINARY.values()) | {operator.neg, operator.pos}
+# Python ints that fit in the int64 arrays NumPy computes on
+_INT64_LIMIT = 2 ** 63
+_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "lower": lambda value: value.lower(),
+    "upper": lambda value: value.upper(),
+}
+_AGGREGATES = ("sum", "mean", "min", "max", "count")
+
+Path = Tuple[Any, ...]
+
+def _field(record: Any, path: Path) -> Any:
+    """Get a field of a record, None if it does not exist"""
+    value = record
+    for key in path:
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, (list, tuple)) and isinstance(key, int) and -len(value) <= key < len(value):
+            value = value[key]
+        else:
+            return None
+    return value
+
+class _Column(list):
+    """Values of one field across a batch, as opposed to a scalar"""
+
+class _PythonOps:
+    """Column operations on Python lists"""
+
+    name = "python"
+
+    @staticmethod
+    def column(values: List[Any]) -> _Column:
+        return _Column(values)
+
+    @staticmethod
+    def apply(fn: Callable, *args: Any) -> Any:
+        if not any(isinstance(arg, _Column) for arg in args):
+            return fn(*args)
+        return _Column(map(fn, *(arg if isinstance(arg, _Column) else repeat(arg) for arg in args)))
+
+    binary = apply
+    unary = apply
+    call = apply
+
+    @staticmethod
+    def truth(value: Any) -> Any:
+        if isinstance(value, _Column):
+            return _Column(map(bool, value))
+        return bool(value)
+
+    @classmethod
+    def logical_and(cls, a: Any, b: Any) -> Any:
+        return cls.apply(lambda x, y: bool(x) and bool(y), a, b)
+
+    @classmethod
+    def logical_or(cls, a: Any, b: Any) -> Any:
+        return cls.apply(lambda x, y: bool(x) or bool(y), a, b)
+
+    @classmethod
+    def logical_not(cls, a: Any) -> Any:
+        return cls.apply(operator.not_, a)
+
+    @classmethod
+    def where(cls, condition: Any, a: Any, b: Any) -> Any:
+        return cls.apply(lambda c, x, y: x if c else y, condition, a, b)
+
+    @classmethod
+    def isin(cls, a: Any, values: frozenset) -> Any:
+        return cls.apply(values.__contains__, a)
+
+    @staticmethod
+    def aggregate(name: str, value: Any, n: int) -> Any:
+        if name == "count":
+            if value is None:
+                return n
+            return sum(map(bool, value)) if isinstance(value, _Column) else (n if value else 0)
+
+        values = value if isinstance(value, _Column) else [value] * n
+        if name == "sum":
+            return sum(values)
+        if not values:
+            return None
+        if name == "mean":
+            return sum(values) / len(values)
+        return min(values) if name == "min" else max(values)
+
+    @staticmethod
+    def to_list(value: Any, n: int) -> List[Any]:
+        return list(value) if isinstance(value, _Column) else [value] * n
+
+    @classmethod
+    def mask_indices(cls, mask: Any, n: int) -> List[int]:
+        if not isinstance(mask, _Column):
+            return list(range(n)) if mask else []
+        return [i for i, keep in enumerate(mask) if keep]
+
+    @classmethod
+    def argsort(cls, keys: Sequence[Any], n: int, descending: bool) -> List[int]:
+        columns = [cls.to_list(key, n) for key in keys]
+        if len(columns) > 1:
+            # Missing values of every element go last in either direction,
+            # and are never compared with present ones
+            last = (lambda value: value is not None) if descending else (lambda value: value is None)
+            rows = [tuple((last(value), value) for value in row) for row in zip(*columns)]
+            return sorted(range(n), key=rows.__getitem__, reverse=descending)
+
+        # Records without the field go last in either direction
+        values = columns[0]
+        present = [i for i in range(n) if values[i] is not None]
+        missing = [i for i in range(n) if values[i] is None]
+        return sorted(present, key=values.__getitem__, reverse=descending) + missing
+
+class _NumpyOps(_PythonOps):
+    """Column operations on NumPy arrays
+
+    Numeric fields become typed arrays that operators work on in bulk;
+    anything else becomes an object array whose operators call back into
+    Python per element, which still skips the interpreter loop around them.
+    Results match those of ``_PythonOps``: a field that mixes ints and floats,
+    or an int operation that could overflow int64, falls back to objects.
+    """
+
+    name = "numpy"
+
+    @staticmethod
+    def _objects(values: List[Any]):
+        try:
+            return np.fromiter(values, dtype=object, count=len(values))
+        except (TypeError, ValueError):
+            # NumPy before 1.23 cannot build object arrays from iterators
+            array = np.empty(len(values), dtype=object)
+            for i, value in enumerate(values):
+                array[i] = value
+            return array
+
+    @classmethod
+    def _normalize(cls, value: Any) -> Any:
+        # Fixed-width string arrays do not support most operators
+        if isinstance(value, np.ndarray) and value.dtype.kind in "USV":
+            return value.astype(object)
+        return value
+
+    @classmethod
+    def _as_objects(cls, value: Any, n: int):
+        if cls._is_array(value):
+            return value if value.dtype == object else value.astype(object)
+        array = np.empty(n, dtype=object)
+        array.fill(value)
+        return array
+
+    @classmethod
+    def column(cls, values: List[Any]):
+        # Only fields of a single type become typed arrays, so ints are not
+        # promoted to floats and bools are not promoted to ints
+        kind = type(values[0]) if values else None
+        if kind in (bool, int, float) and all(type(value) is kind for value in values):
+            try:
+                return np.array(values, dtype=kind)
+            except OverflowError:
+                # Ints beyond int64 stay Python ints
+                pass
+        return cls._objects(values)
+
+    @staticmethod
+    def _is_array(value: Any) -> bool:
+        return isinstance(value, np.ndarray)
+
+    @classmethod
+    def _kind(cls, value: Any) -> Optional[str]:
+        """Get the kind of a typed array or number: b, i or f, None for anything else"""
+        if cls._is_array(value):
+            return value.dtype.kind if value.dtype.kind in "bif" else None
+        if isinstance(value, bool):
+            return "b"
+        if isinstance(value, int):
+            return "i" if -_INT64_LIMIT <= value < _INT64_LIMIT else None
+        return "f" if isinstance(value, float) else None
+
+    @classmethod
+    def _magnitude(cls, value: Any) -> int:
+        if cls._is_array(value):
+            return max(abs(int(value.min())), abs(int(value.max()))) if value.size else 0
+        return abs(int(value))
+
+    @classmethod
+    def _overflows(cls, fn: Callable, a: Any, b: Any) -> bool:
+        """Check whether an int operation could leave the int64 range"""
+        if fn is operator.add or fn is operator.sub:
+            bound = cls._magnitude(a) + cls._magnitude(b)
+        elif fn is operator.mul:
+            bound = cls._magnitude(a) * cls._magnitude(b)
+        elif fn is operator.pow:
+            bound = cls._magnitude(a) ** cls._magnitude(b)
+        else:
+            return False
+        return bound >= _INT64_LIMIT
+
+    @classmethod
+    def apply(cls, fn: Callable, *args: Any) -> Any:
+        if not any(cls._is_array(arg) for arg in args):
+            return fn(*args)
+        return np.frompyfunc(fn, len(args), 1)(*args)
+
+    @classmethod
+    def binary(cls, fn: Callable, a: Any, b: Any) -> Any:
+        if not cls._is_array(a) and not cls._is_array(b):
+            return fn(a, b)
+        kinds = (cls._kind(a), cls._kind(b))
+        if None in kinds:
+            # Object arrays call the Python operator per element
+            return cls._normalize(fn(a, b)) if fn not in _ARRAY_OPERATORS else cls.apply(fn, a, b)
+        if fn not in _ARITHMETIC:
+            return fn(a, b)
+
+        # Python does arithmetic on bools as ints
+        a, b = (value.astype(np.int64) if cls._is_array(value) and value.dtype == bool else value for value in (a, b))
+        raw = _ARRAY_OPERATORS.get(fn, fn)
+        if "f" not in kinds and cls._overflows(raw, a, b):
+            return cls.apply(fn, a, b)
+        if raw is operator.pow and cls._is_array(a) and a.dtype.kind == "i" and b < 0:
+            # Integer arrays cannot be raised to negative powers
+            a = a.astype(np.float64)
+
+        result = raw(a, b)
+        if fn in _DIVISION:
+            # Python raises where NumPy gives inf or nan, and both engines give None there
+            zero = (a == 0) & (b < 0) if raw is operator.pow else (b == 0)
+            if np.any(zero):
+                result = result.astype(object)
+                result[np.broadcast_to(zero, result.shape)] = None
+        return result
+
+    @classmethod
+    def unary(cls, fn: Callable, a: Any) -> Any:
+        if cls._is_array(a) and a.dtype == bool:
+            a = a.astype(np.int64)
+        return cls._normalize(fn(a))
+
+    @classmethod
+    def call(cls, fn: Callable, *args: Any) -> Any:
+        value = args[0] if len(args) == 1 else None
+        if cls._is_array(value) and value.dtype.kind in "biuf":
+            if fn is abs:
+                return np.abs(value)
+            if fn is float:
+                return value.astype(np.float64)
+            if fn is int and value.dtype.kind != "f":
+                return value.astype(np.int64)
+        return cls.apply(fn, *args)
+
+    @classmethod
+    def truth(cls, value: Any) -> Any:
+        if cls._is_array(value):
+            return value if value.dtype == bool else value.astype(bool)
+        return bool(value)
+
+    @classmethod
+    def logical_and(cls, a: Any, b: Any) -> Any:
+        return np.logical_and(cls.truth(a), cls.truth(b))
+
+    @classmethod
+    def logical_or(cls, a: Any, b: Any) -> Any:
+        return np.logical_or(cls.truth(a), cls.truth(b))
+
+    @classmethod
+    def logical_not(cls, a: Any) -> Any:
+        return np.logical_not(cls.truth(a))
+
+    @classmethod
+    def where(cls, condition: Any, a: Any, b: Any) -> Any:
+        if not cls._is_array(condition):
+            return a if condition else b
+        kind = cls._kind(a)
+        if kind is None or kind != cls._kind(b):
+            # Branches of different types would be promoted to a common one,
+            # such as numbers to strings, so they are kept as objects
+            n = len(condition)
+            return np.where(condition, cls._as_objects(a, n), cls._as_objects(b, n))
+        return np.where(condition, a, b)
+
+    @classmethod
+    def isin(cls, a: Any, values: frozenset) -> Any:
+        if cls._is_array(a) and a.dtype.kind in "biuf" and all(isinstance(v, (int, float)) for v in values):
+            return np.isin(a, list(values))
+        return cls.apply(values.__contains__, a)
+
+    @classmethod
+    def aggregate(cls, name: str, value: Any, n: int) -> Any:
+        if not cls._is_array(value):
+            return super().aggregate(name, value, n)
+        if name == "count":
+            return int(np.count_nonzero(cls.truth(value)))
+        if name == "sum":
+            if value.dtype.kind in "bi" and cls._magnitude(value) * n >= _INT64_LIMIT:
+                return sum(value.tolist())
+            result = value.sum()
+        elif n == 0:
+            return None
+        elif name == "mean":
+            result = value.mean() if value.dtype.kind in "biuf" else value.sum() / n
+        else:
+            result = value.min() if name == "min" else value.max()
+        return result.item() if isinstance(result, np.generic) else result
+
+    @classmethod
+    def to_list(cls, value: Any, n: int) -> List[Any]:
+        if cls._is_array(value):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            value = value.item()
+        return [value] * n
+
+    @classmethod
+    def mask_indices(cls, mask: Any, n: int) -> List[int]:
+        if not cls._is_array(mask):
+            return list(range(n)) if mask else []
+        return np.flatnonzero(cls.truth(mask)).tolist()
+
+    @classmethod
+    def argsort(cls, keys: Sequence[Any], n: int, descending: bool) -> List[int]:
+        key = keys[0]
+        if len(keys) == 1 and cls._is_array(key) and key.dtype.kind in "biuf":
+            if key.dtype.kind in "bu":
+                key = key.astype(np.float64)
+            return np.argsort(-key if descending else key, kind="stable").tolist()
+        return super().argsort(keys, n, descending)
+
+def _ops():
+    if np is not None and settings.transform_engine != "python":
+        return _NumpyOps
+    return _PythonOps
+
+class _Batch:
+    """Records of one batch and the columns extracted from them so far"""
+
+    def __init__(self, records: List[Any], ops):
+        self.records = records
+        self.n = len(records)
+        self.ops = ops
+        self.columns: Dict[Path, Any] = {}
+
+    def column(self, path: Path) -> Any:
+        column = self.columns.get(path)
+        if column is None:
+            if not path:
+                values = self.records
+            elif len(path) == 1:
+                try:
+                    values = list(map(dict.get, self.records, repeat(path[0])))
+                except TypeError:
+                    values = [_field(record, path) for record in self.records]
+            else:
+                values = [_field(record, path) for record in self.records]
+            column = self.columns[path] = self.ops.column(values)
+        return column
+
+Evaluator = Callable[[_Batch], Any]
+
+class _Compiler:
+    """Turn a checked expression AST into a tree of column evaluators"""
+
+    def __init__(self, transformation: str):
+        self.transformation = transformation
+        self.in_aggregate = False
+        self.paths: List[Path] = []
+
+    def compile(self, node: ast.AST, top: bool = False) -> Evaluator:
+        method = getattr(self, f"_{type(node).__name__}", None)
+        if method is None:
+            raise ValueError(f"Unsupported syntax in transform expression: {type(node).__name__}")
+        if isinstance(node, (ast.Dict, ast.Tuple)) and not top:
+            raise ValueError(f"{type(node).__name__} literals are only allowed as the whole expression")
+        return method(node)
+
+    def _field_path(self, node: ast.AST) -> Optional[Path]:
+        """Get the record field a name, attribute or subscript chain refers to"""
+        if isinstance(node, ast.Name):
+            return () if node.id == "item" else (node.id,)
+        if isinstance(node, ast.Attribute):
+            parent = self._field_path(node.value)
+            return None if parent is None else parent + (node.attr,)
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant):
+            key = node.slice.value
+            parent = self._field_path(node.value)
+            if parent is None or not isinstance(key, (str, int)) or isinstance(key, bool):
+                return None
+            return parent + (key,)
+        return None
+
+    def _field(self, node: ast.AST) -> Evaluator:
+        path = self._field_path(node)
+        if path is None:
+            raise ValueError("Only record fields can be accessed, e.g. name, address.city or item['first name']")
+        if self.transformation == "reduce" and not self.in_aggregate:
+            raise ValueError("Fields of a reduce expression must be inside an aggregate such as sum(price)")
+        if path and path not in self.paths:
+            self.paths.append(path)
+        return lambda batch: batch.column(path)
+
+    _Name = _field
+    _Attribute = _field
+    _Subscript = _field
+
+    def _Constant(self, node: ast.Constant) -> Evaluator:
+        value = node.value
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            raise ValueError(f"Unsupported constant in transform expression: {value!r}")
+        return lambda batch: value
+
+    def _BinOp(self, node: ast.BinOp) -> Evaluator:
+        fn = _BINARY.get(type(node.op))
+        if fn is None:
+            raise ValueError(f"Unsupported operator in transform expression: {type(node.op).__name__}")
+        if isinstance(node.op, ast.Pow) and not (
+            isinstance(node.right, ast.Constant)
+            and isinstance(node.right.value, (int, float))
+            and abs(node.right.value) <= _MAX_POWER
+        ):
+            raise ValueError(f"Exponents must be numbers up to {_MAX_POWER}")
+        if isinstance(node.op, ast.Mult) and (self._is_string(node.left) or self._is_string(node.right)):
+            raise ValueError("Strings and lists cannot be multiplied in transform expressions")
+        if isinstance(node.op, ast.Mod) and self._is_string(node.left):
+            raise ValueError("Strings cannot be formatted with % in transform expressions")
+        left, right = self.compile(node.left), self.compile(node.right)
+        return lambda batch: batch.ops.binary(fn, left(batch), right(batch))
+
+    @staticmethod
+    def _is_string(node: ast.AST) -> bool:
+        """Check whether an expression is known to give a string before it runs"""
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, str)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            return node.func.id in ("str", "lower", "upper")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            return _Compiler._is_string(node.left) or _Compiler._is_string(node.right)
+        return False
+
+    def _UnaryOp(self, node: ast.UnaryOp) -> Evaluator:
+        operand = self.compile(node.operand)
+        if isinstance(node.op, ast.Not):
+            return lambda batch: batch.ops.logical_not(operand(batch))
+        fn = _UNARY.get(type(node.op))
+        if fn is None:
+            raise ValueError(f"Unsupported operator in transform expression: {type(node.op).__name__}")
+        return lambda batch: batch.ops.unary(fn, operand(batch))
+
+    def _BoolOp(self, node: ast.BoolOp) -> Evaluator:
+        values = [self.compile(value) for value in node.values]
+        combine = "logical_and" if isinstance(node.op, ast.And) else "logical_or"
+
+        def evaluate(batch: _Batch) -> Any:
+            result = values[0](batch)
+            for value in values[1:]:
+                result = getattr(batch.ops, combine)(result, value(batch))
+            return result
+        return evaluate
+
+    def _Compare(self, node: ast.Compare) -> Evaluator:
+        # a < b < c is (a < b) and (b < c), with b evaluated once
+        operands = [self.compile(node.left)]
+        steps = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                steps.append((op, self._membership(comparator)))
+                operands.append(None)
+                continue
+            fn = _COMPARE.get(type(op))
+            if fn is None:
+                raise ValueError(f"Unsupported comparison in transform expression: {type(op).__name__}")
+            steps.append((fn, None))
+            operands.append(self.compile(comparator))
+
+        def evaluate(batch: _Batch) -> Any:
+            ops = batch.ops
+            left = operands[0](batch)
+            result = None
+            for (fn, membership), operand in zip(steps, operands[1:]):
+                if membership is not None:
+                    value = membership(batch, left)
+                    value = ops.logical_not(value) if isinstance(fn, ast.NotIn) else value
+                else:
+                    right = operand(batch)
+                    value = ops.binary(fn, left, right)
+                    left = right
+                result = value if result is None else ops.logical_and(result, value)
+            return result
+        return evaluate
+
+    def _membership(self, node: ast.AST) -> Callable[[_Batch, Any], Any]:
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            if not all(isinstance(element, ast.Constant) for element in node.elts):
+                raise ValueError("Lists after 'in' may only contain constants")
+            values = frozenset(element.value for element in node.elts)
+            return lambda batch, left: batch.ops.isin(left, values)
+
+        container = self.compile(node)
+        return lambda batch, left: batch.ops.apply(lambda item, values: item in values, left, container(batch))
+
+    def _IfExp(self, node: ast.IfExp) -> Evaluator:
+        test, body, orelse = self.compile(node.test), self.compile(node.body), self.compile(node.orelse)
+        return lambda batch: batch.ops.where(batch.ops.truth(test(batch)), body(batch), orelse(batch))
+
+    def _Call(self, node: ast.Call) -> Evaluator:
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError("Only plain calls of transform functions are allowed")
+        name = node.func.id
+
+        if name in _AGGREGATES:
+            if self.transformation != "reduce":
+                raise ValueError(f"{name}() can only be used in reduce expressions")
+            if self.in_aggregate:
+                raise ValueError("Aggregates cannot be nested")
+            if len(node.args) > 1 or (not node.args and name != "count"):
+                raise ValueError(f"{name}() takes one argument")
+
+            self.in_aggregate = True
+            argument = self.compile(node.args[0]) if node.args else None
+            self.in_aggregate = False
+            return lambda batch: batch.ops.aggregate(name, argument(batch) if argument else None, batch.n)
+
+        fn = _FUNCTIONS.get(name)
+        if fn is None:
+            raise ValueError(f"Unknown transform function: {name}")
+        args = [self.compile(arg) for arg in node.args]
+        return lambda batch: batch.ops.call(fn, *(arg(batch) for arg in args))
+
+    def _Dict(self, node: ast.Dict) -> Evaluator:
+        if not all(isinstance(key, ast.Constant) and isinstance(key.value, str) for key in node.keys):
+            raise ValueError("Keys of an output object must be strings")
+        keys = [key.value for key in node.keys]
+        values = [self.compile(value) for value in node.values]
+        return lambda batch: {key: value(batch) for key, value in zip(keys, values)}
+
+    def _Tuple(self, node: ast.Tuple) -> Evaluator:
+        if self.transformation != "sort":
+            raise ValueError("Tuples are only allowed as sort keys")
+        values = [self.compile(value) for value in node.elts]
+        return lambda batch: [value(batch) for value in values]
+
+@lru_cache(maxsize=256)
+def _row_builder(keys: Tuple[str, ...]) -> Callable:
+    """Get a function that turns rows of values into dicts with the given keys"""
+    # A dict display in a comprehension builds rows about three times faster
+    # than dict(zip(keys, row)); keys are string constants, so their repr is safe
+    names = [f"v{i}" for i in range(len(keys))]
+    fields = ", ".join(f"{key!r}: {name}" for key, name in zip(keys, names))
+    return eval(f"lambda rows: [{{{fields}}} for {', '.join(names)}, in rows]", {})
+
+class Transform:
+    """A map, filter, reduce or sort compiled from an expression
+
+    Expressions are a restricted subset of Python evaluated against each
+    record, with its fields as names: ``price * quantity``,
+    ``{"name": name, "city": address.city}``, ``status == "active" and
+    age >= 18``, ``-score``, ``(country, -score)``, or aggregates in reduce
+    such as ``sum(price * quantity) / count()``. They are checked and
+    compiled once, then evaluated column by column over batches of records.
+    """
+
+    def __init__(self, transformation: str, expression: str):
+        if transformation not in TRANSFORMATIONS:
+            raise ValueError(f"Unknown transformation: {transformation}")
+        if not expression or len(expression) > _MAX_EXPRESSION_LENGTH:
+            raise ValueError(f"Transform expressions must have 1 to {_MAX_EXPRESSION_LENGTH} characters")
+
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid transform expression: {e.msg}")
+        if sum(1 for _ in ast.walk(tree)) > _MAX_EXPRESSION_NODES:
+            raise ValueError("Transform expression is too complex")
+
+        compiler = _Compiler(transformation)
+        self.transformation = transformation
+        self.expression = expression
+        self.evaluate = compiler.compile(tree.body, top=True)
+        self.paths = tuple(compiler.paths)
+        self.is_tuple = isinstance(tree.body, ast.Tuple)
+
+    def apply(self, records: List[Any], descending: bool = False) -> Any:
+        """Run the transform over a list of records"""
+        ops = _ops()
+        if ops is _NumpyOps:
+            with np.errstate(all="ignore"):
+                return self._apply(records, ops, descending)
+        return self._apply(records, ops, descending)
+
+    def _apply(self, records: List[Any], ops, descending: bool) -> Any:
+        if self.transformation == "reduce":
+            result = self.evaluate(_Batch(records, ops))
+            if isinstance(result, dict):
+                return {key: ops.to_list(value, 1)[0] for key, value in result.items()}
+            return ops.to_list(result, 1)[0]
+
+        if self.transformation == "sort":
+            batch = _Batch(records, ops)
+            keys = self.evaluate(batch)
+            order = ops.argsort(keys if self.is_tuple else [keys], batch.n, descending)
+            return [records[i] for i in order]
+
+        # Map and filter only look at one record at a time, so they run in
+        # batches that bound the size of intermediate columns
+        output: List[Any] = []
+        size = max(1, settings.transform_batch_size)
+        for start in range(0, len(records), size):
+            batch = _Batch(records[start:start + size], ops)
+            try:
+                result = self.evaluate(batch)
+            except TypeError:
+                if self.transformation != "map":
+                    raise
+                # Usually records without a field the expression uses; only
+                # those records get an error
+                output.extend(self._map_each(batch.records, ops))
+                continue
+
+            if self.transformation == "filter":
+                output.extend(batch.records[i] for i in ops.mask_indices(result, batch.n))
+            elif isinstance(result, dict):
+                columns = [ops.to_list(value, batch.n) for value in result.values()]
+                output.extend(_row_builder(tuple(result))(zip(*columns)) if columns else ({} for _ in batch.records))
+            else:
+                output.extend(ops.to_list(result, batch.n))
+        return output
+
+    def _map_each(self, records: List[Any], ops) -> List[Any]:
+        """Map records one at a time, with an error for each record that fails"""
+        output: List[Any] = []
+        for record in records:
+            try:
+                result = self.evaluate(_Batch([record], ops))
+            except TypeError as e:
+                missing = [".".join(map(str, path)) for path in self.paths if _field(record, path) is None]
+                if missing:
+                    output.append({"error": f"Missing or null field: {', '.join(missing)}"})
+                else:
+                    output.append({"error": f"TypeError: {e}"})
+                continue
+
+            if isinstance(result, dict):
+                output.append({key: ops.to_list(value, 1)[0] for key, value in result.items()})
+            else:
+                output.append(ops.to_list(result, 1)[0])
+        return output
+
+@lru_cache(maxsize=1024)
+def compile_transform(transformation: str, expression: str) -> Transform:
+    """Get the compiled form of a transform"""
+    return Transform(transformation, expression)
+
+def transform_engine() -> str:
+    """Get the name of the engine transforms run on"""
+    return _ops().name
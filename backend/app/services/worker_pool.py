@@ -0,0 +1,372 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import resource
+import socket
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.execution_plan import ExecutionPlan
+from app.services.execution_recorder import StepCollector
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Messages are pickled and compressed once they are large enough for the
+# compression to pay for itself; the first byte tells the two apart
+_RAW = b"\x00"
+_COMPRESSED = b"\x01"
+_COMPRESSION_THRESHOLD = 16 * 1024
+
+# zlib releases the GIL, so larger messages are compressed and decompressed
+# in a thread while the event loop keeps running
+_THREAD_THRESHOLD = 1024 * 1024
+
+def _pack(data: bytes) -> bytes:
+    if len(data) >= _COMPRESSION_THRESHOLD:
+        return _COMPRESSED + zlib.compress(data, 1)
+    return _RAW + data
+
+def decode_message(data: bytes) -> Any:
+    """Deserialize an IPC message"""
+    body = memoryview(data)[1:]
+    if data[:1] == _COMPRESSED:
+        return pickle.loads(zlib.decompress(body))
+    return pickle.loads(body)
+
+# Every message on the socket is prefixed with its length
+_FRAME_HEADER = struct.Struct("!Q")
+
+async def write_message(writer: asyncio.StreamWriter, message: Any):
+    """Queue a message on a stream; the transport sends it without blocking the event loop"""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    data = await asyncio.to_thread(_pack, data) if len(data) >= _THREAD_THRESHOLD else _pack(data)
+    writer.writelines((_FRAME_HEADER.pack(len(data)), data))
+
+async def read_message(reader: asyncio.StreamReader) -> Any:
+    """Read the next message from a stream, waiting for all of its frame"""
+    (size,) = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    data = await reader.readexactly(size)
+    if size >= _THREAD_THRESHOLD:
+        return await asyncio.to_thread(decode_message, data)
+    return decode_message(data)
+
+class WorkerExecutionError(Exception):
+    """An execution that failed inside a worker process, with the steps it recorded"""
+
+    def __init__(self, message: str, steps: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.steps = steps
+
+class _WorkerRuntime:
+    """Event loop side of a worker process"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.plans: "OrderedDict[Tuple, ExecutionPlan]" = OrderedDict()
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.loop_lag_ms = 0.0
+
+    async def run(self):
+        from app.database import connect_to_mongo
+        from app.services.execution_service import ExecutionService
+
+        try:
+            await connect_to_mongo()
+        except Exception as e:
+            logger.warning(f"Execution worker {os.getpid()} runs without MongoDB: {e}")
+
+        self.service = ExecutionService()
+        self.closed = asyncio.get_running_loop().create_future()
+        reader, self.writer = await asyncio.open_connection(sock=self.sock)
+        reading = asyncio.create_task(self._read(reader))
+        reporter = asyncio.create_task(self._report_health())
+
+        try:
+            await self.closed
+        finally:
+            reading.cancel()
+            reporter.cancel()
+            for task in self.tasks.values():
+                task.cancel()
+            self.writer.close()
+
+    def _close(self):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                self._handle(await read_message(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._close()
+        except Exception as e:
+            # The stream cannot be trusted after a bad message; exiting lets
+            # the API process fail the runs and start a new worker
+            logger.error(f"Execution worker {os.getpid()} failed to handle a message: {e}")
+            self._close()
+
+    def _handle(self, message: tuple):
+        kind = message[0]
+
+        if kind == "plan":
+            _, key, plan = message
+            self.plans[key] = plan
+            while len(self.plans) > settings.plan_cache_size:
+                self.plans.popitem(last=False)
+
+        elif kind == "run":
+            _, request_id, key, input_data, completed = message
+            self.plans.move_to_end(key)
+            self.tasks[request_id] = asyncio.create_task(
+                self._run(request_id, self.plans[key], input_data, completed)
+            )
+
+        elif kind == "cancel":
+            task = self.tasks.get(message[1])
+            if task is not None:
+                task.cancel()
+
+        elif kind == "stop":
+            self._close()
+
+    async def _run(self, request_id: int, plan: ExecutionPlan, input_data: Dict[str, Any], completed):
+        collector = StepCollector()
+        try:
+            results = await self.service.execute_plan(plan, input_data, collector, completed)
+            reply = ("result", request_id, True, results, collector.steps)
+            self.completed += 1
+        except asyncio.CancelledError:
+            reply = ("result", request_id, False, "Execution cancelled", collector.steps)
+        except Exception as e:
+            reply = ("result", request_id, False, str(e), collector.steps)
+            self.failed += 1
+        finally:
+            self.tasks.pop(request_id, None)
+
+        await self._send(reply)
+
+    async def _send(self, message: tuple):
+        # Draining waits while the API process is behind on reading, without
+        # blocking the event loop; a large write never stalls other runs
+        try:
+            await write_message(self.writer, message)
+            await self.writer.drain()
+        except ConnectionError:
+            self._close()
+
+    async def _report_health(self):
+        interval = settings.worker_health_interval
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag_ms = max(0.0, (time.perf_counter() - start - interval) * 1000)
+
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            await self._send(("health", {
+                "pid": os.getpid(),
+                "running": len(self.tasks),
+                "completed": self.completed,
+                "failed": self.failed,
+                "cpu_seconds": usage.ru_utime + usage.ru_stime,
+                "max_rss_kb": usage.ru_maxrss,
+                "loop_lag_ms": self.loop_lag_ms,
+                "reported_at": time.time()
+            }))
+
+def _worker_main(sock: socket.socket):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_WorkerRuntime(sock).run())
+
+class _WorkerHandle:
+    """API process side of a worker process"""
+
+    def __init__(self, index: int, process, writer: asyncio.StreamWriter):
+        self.index = index
+        self.process = process
+        self.writer = writer
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.reading: Optional[asyncio.Task] = None
+        self.writing: Optional[asyncio.Task] = None
+        self.inflight = 0
+        self.dispatched = 0
+        self.plans: "OrderedDict[Tuple, None]" = OrderedDict()
+        self.health: Dict[str, Any] = {}
+
+    def send(self, message: tuple):
+        """Queue a message for the writer task of the worker"""
+        if self.writer.is_closing():
+            raise ConnectionResetError("Execution worker connection is closed")
+        self.outgoing.put_nowait(message)
+
+class ProcessWorkerPool:
+    """Run compiled plans in child processes, each with its own event loop
+
+    Plans are shipped to a worker the first time it runs them and kept in a
+    per-worker LRU that the API process mirrors, so hot workflows only send
+    their input. Work goes to the worker with the fewest runs in flight.
+    """
+
+    def __init__(self):
+        self.workers: List[_WorkerHandle] = []
+        self.pending: Dict[int, Tuple[_WorkerHandle, asyncio.Future]] = {}
+        self.request_ids = itertools.count()
+        self.running = False
+        self._context = multiprocessing.get_context("spawn")
+
+    async def start(self, size: int):
+        """Start the worker processes"""
+        self.workers = [await self._spawn(index) for index in range(size)]
+        self.running = True
+        logger.info(f"Started {size} execution worker processes")
+
+    async def _spawn(self, index: int) -> _WorkerHandle:
+        # Both ends of the socket pair are driven by asyncio streams, so
+        # messages of any size are written and read without blocking a loop
+        parent_sock, child_sock = socket.socketpair()
+        # Sandbox workers are plain subprocesses, so workers can be daemonic
+        process = self._context.Process(target=_worker_main, args=(child_sock,), daemon=True)
+        process.start()
+        child_sock.close()
+
+        reader, writer = await asyncio.open_connection(sock=parent_sock)
+        handle = _WorkerHandle(index, process, writer)
+        handle.reading = asyncio.create_task(self._read(handle, reader))
+        handle.writing = asyncio.create_task(self._write(handle))
+        return handle
+
+    async def _write(self, handle: _WorkerHandle):
+        # A single writer per worker keeps messages in order, such as a plan
+        # before its first run, however long a large one takes to encode
+        try:
+            while True:
+                await write_message(handle.writer, await handle.outgoing.get())
+                # Wait while the worker is behind on reading, rather than
+                # buffering without bound
+                await handle.writer.drain()
+        except ConnectionError:
+            # The reader sees the worker exit and replaces it
+            pass
+
+    async def _read(self, handle: _WorkerHandle, reader: asyncio.StreamReader):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == "result":
+                    _, request_id, ok, payload, steps = message
+                    entry = self.pending.get(request_id)
+                    if entry is not None and not entry[1].done():
+                        entry[1].set_result((ok, payload, steps))
+                elif message[0] == "health":
+                    handle.health = message[1]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self._replace(handle)
+        except Exception as e:
+            # A message that cannot be decoded leaves the stream out of sync,
+            # so the worker is replaced even though it is still running
+            logger.error(f"Failed to read from execution worker {handle.index}: {e}")
+            if handle.process.is_alive():
+                handle.process.terminate()
+            await self._replace(handle)
+
+    async def _replace(self, handle: _WorkerHandle):
+        """Fail the runs of a dead worker and start a new one in its place"""
+        handle.writing.cancel()
+        handle.writer.close()
+
+        for request_id, (owner, future) in list(self.pending.items()):
+            if owner is handle and not future.done():
+                future.set_result((False, "Execution worker exited unexpectedly", []))
+
+        if self.running:
+            logger.error(f"Execution worker {handle.index} exited, restarting it")
+            metrics.increment("worker_pool.restarts")
+            self.workers[handle.index] = await self._spawn(handle.index)
+
+    async def execute(
+        self,
+        plan: ExecutionPlan,
+        input_data: Dict[str, Any],
+        completed: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Run a plan in the least loaded worker and return its results and steps"""
+        handle = min(self.workers, key=lambda worker: worker.inflight)
+
+        key = (plan.workflow_id, plan.revision)
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (handle, future)
+        handle.inflight += 1
+        handle.dispatched += 1
+
+        try:
+            if key in handle.plans:
+                handle.plans.move_to_end(key)
+            else:
+                handle.send(("plan", key, plan))
+                handle.plans[key] = None
+                while len(handle.plans) > settings.plan_cache_size:
+                    handle.plans.popitem(last=False)
+
+            handle.send(("run", request_id, key, dict(input_data), completed))
+            ok, payload, steps = await future
+        except ConnectionError:
+            # The reader of the worker fails the other runs and replaces it
+            ok, payload, steps = False, "Execution worker exited unexpectedly", []
+        except asyncio.CancelledError:
+            try:
+                handle.send(("cancel", request_id))
+            except ConnectionError:
+                pass
+            raise
+        finally:
+            handle.inflight -= 1
+            self.pending.pop(request_id, None)
+
+        if not ok:
+            raise WorkerExecutionError(payload, steps)
+        return payload, steps
+
+    def health(self) -> List[Dict[str, Any]]:
+        """Get the health and load of every worker"""
+        return [
+            {
+                "index": handle.index,
+                "pid": handle.process.pid,
+                "alive": handle.process.is_alive(),
+                "inflight": handle.inflight,
+                "dispatched": handle.dispatched,
+                **handle.health
+            }
+            for handle in self.workers
+        ]
+
+    async def stop(self):
+        """Stop all worker processes"""
+        self.running = False
+
+        for handle in self.workers:
+            handle.reading.cancel()
+            handle.writing.cancel()
+            if not handle.writer.is_closing():
+                await write_message(handle.writer, ("stop",))
+                # Closing flushes the stop message first
+                handle.writer.close()
+
+        for handle in self.workers:
+            await asyncio.to_thread(handle.process.join, 5)
+            if handle.process.is_alive():
+                handle.process.terminate()
+
+        self.workers = []
+
+worker_pool = ProcessWorkerPool()
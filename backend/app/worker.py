@@ -0,0 +1,139 @@
+"""
+Run queued workflow executions
+
+Usage: python -m app.worker [--concurrency N] [--processes N]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Dict, Any
+from app.core.config import settings
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.services.execution_service import ExecutionService
+from app.services.execution_registry import ExecutionCancelledError, execution_registry
+from app.services.job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+class ExecutionWorker:
+    """Lease jobs from the execution queue and run them"""
+
+    def __init__(self, concurrency: int):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = concurrency
+
+    async def run(self):
+        """Run lease loops until cancelled"""
+        await connect_to_mongo()
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+
+        try:
+            await asyncio.gather(*(self._lease_loop() for _ in range(self.concurrency)))
+        finally:
+            await close_mongo_connection()
+
+    async def _lease_loop(self):
+        while True:
+            try:
+                job = await JobQueue.lease(self.worker_id)
+            except Exception as e:
+                logger.error(f"Failed to lease job: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(settings.job_poll_interval)
+                continue
+
+            await self._process(job)
+
+    async def _process(self, job: Dict[str, Any]):
+        """Run one leased job while keeping its lease alive"""
+        if job["attempts"] > settings.job_max_attempts:
+            error_message = f"Execution abandoned after {job['attempts'] - 1} attempts"
+            await JobQueue.finish(job["_id"], self.worker_id, "failed", error_message)
+            await get_database().executions.update_one(
+                {"_id": job["execution_id"]},
+                {"$set": {"status": "failed", "error_message": error_message, "updated_at": datetime.utcnow()}}
+            )
+            return
+
+        task = asyncio.create_task(ExecutionService().run_job(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, task))
+        watcher = asyncio.create_task(self._watch_cancellation(job))
+
+        try:
+            await asyncio.wait([task])
+        finally:
+            heartbeat.cancel()
+            watcher.cancel()
+            task.cancel()
+
+        if task.cancelled():
+            # The lease was lost and the job now belongs to another worker
+            return
+
+        error = task.exception()
+        if error is None:
+            await JobQueue.finish(job["_id"], self.worker_id, "completed")
+        elif isinstance(error, ExecutionCancelledError):
+            await JobQueue.finish(job["_id"], self.worker_id, "cancelled")
+        else:
+            await JobQueue.finish(job["_id"], self.worker_id, "failed", str(error))
+
+    async def _heartbeat(self, job: Dict[str, Any], task: asyncio.Task):
+        while True:
+            await asyncio.sleep(settings.job_lease_seconds / 3)
+            try:
+                if await JobQueue.heartbeat(job["_id"], self.worker_id):
+                    continue
+            except Exception as e:
+                logger.error(f"Heartbeat for job {job['_id']} failed: {e}")
+                continue
+
+            logger.warning(f"Lost lease on job {job['_id']}, cancelling its execution")
+            task.cancel()
+            return
+
+    async def _watch_cancellation(self, job: Dict[str, Any]):
+        """Cancel the running execution once a cancel was requested through the API"""
+        db = get_database()
+        while True:
+            await asyncio.sleep(settings.job_poll_interval)
+            try:
+                execution = await db.executions.find_one(
+                    {"_id": job["execution_id"]}, {"cancel_requested": 1}
+                )
+            except Exception as e:
+                logger.error(f"Failed to check cancellation of job {job['_id']}: {e}")
+                continue
+
+            if execution and execution.get("cancel_requested"):
+                execution_registry.cancel(str(job["execution_id"]))
+                return
+
+def run_worker(concurrency: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(ExecutionWorker(concurrency).run())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued workflow executions")
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency)
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.concurrency)
+    else:
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(args.concurrency,))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -0,0 +1,100 @@
+"""
+Event loop responsiveness while many AI nodes run at once
+
+Runs N concurrent AI node calls against a fake chat model with a fixed
+latency, once through the per-call graph with a synchronous node that was
+used before and once through the cached async graph, and reports the wall
+time and how late a 10 ms ticker on the same loop woke up.
+
+Usage: python -m benchmarks.ai_nodes [--nodes 100] [--latency 0.5]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from langchain.schema import AIMessage, HumanMessage
+from langgraph.graph import StateGraph, END
+from app.services import langchain_service
+from app.services.langchain_service import ChatState, LangChainService
+
+TICK = 0.01
+
+class FakeChatModel:
+    """Chat model that answers after a fixed latency without calling a provider"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, messages):
+        time.sleep(self.latency)
+        return AIMessage(content="ok")
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return AIMessage(content="ok")
+
+class FakePool:
+    def __init__(self, latency: float):
+        self.model = FakeChatModel(latency)
+
+    def get(self, api_key: str, model: str) -> FakeChatModel:
+        return self.model
+
+async def per_call_graph(pool: FakePool, config, input_data):
+    """The AI node as it was: a new graph per call with a blocking node"""
+    def chatbot(state: ChatState):
+        return {"messages": [pool.get(config["api_key"], config["model"]).invoke(state["messages"])]}
+
+    workflow = StateGraph(ChatState)
+    workflow.add_node("chatbot", chatbot)
+    workflow.set_entry_point("chatbot")
+    workflow.add_edge("chatbot", END)
+    app = workflow.compile()
+
+    result = await app.ainvoke({"messages": [HumanMessage(content=config["prompt"].format(input=str(input_data)))]})
+    return {"ai_response": result["messages"][-1].content, "processed": True}
+
+async def measure(run, nodes: int):
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append((time.perf_counter() - start - TICK) * 1000)
+
+    tick_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(nodes)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+
+    lags.sort()
+    return {
+        "wall_seconds": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(lags), 2),
+        "lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1], 2),
+        "lag_max_ms": round(lags[-1], 2)
+    }
+
+async def main(nodes: int, latency: float):
+    pool = FakePool(latency)
+    langchain_service.llm_client_pool = pool
+    service = LangChainService()
+    config = {"api_key": "benchmark", "model": "gpt-3.5-turbo", "prompt": "Process this data: {input}"}
+
+    before = await measure(lambda i: per_call_graph(pool, config, {"item": i}), nodes)
+    after = await measure(lambda i: service.process_with_ai(config, {"item": i}), nodes)
+
+    print(f"{nodes} concurrent AI nodes, {latency * 1000:.0f} ms model latency")
+    for name, result in (("per-call sync graph", before), ("cached async graph", after)):
+        print(f"  {name:20} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent AI nodes")
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(main(args.nodes, args.latency))
@@ -0,0 +1,69 @@
+"""
+Throughput of chat completions against the fake LLM provider
+
+Sends N chat completions with C distinct prompts at once through
+LangChainService, so single-flight coalescing, the response cache, rate
+limiting and hedging all take part, and reports latency percentiles and
+the LLM counters from /metrics.
+
+Usage: python -m benchmarks.llm_load [--calls 500] [--prompts 50]
+       [--rate-limit-rate 0.05] [--cache] [--hedge-percentile 95]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+def configure(args):
+    # Settings are read on import, so the environment has to be set first
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_RATE_LIMIT_RATE"] = str(args.rate_limit_rate)
+    os.environ["FAKE_LLM_RETRY_AFTER"] = "0.2"
+    os.environ["LLM_CACHE_BACKEND"] = "memory"
+    os.environ["LLM_HEDGE_PERCENTILE"] = str(args.hedge_percentile)
+
+async def main(args):
+    from app.core.metrics import metrics
+    from app.services.langchain_service import LangChainService
+
+    service = LangChainService()
+    latencies = []
+
+    async def call(i: int):
+        start = time.perf_counter()
+        await service.chat_completion(
+            api_key="benchmark",
+            model="fake-model",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": f"Question {i % args.prompts}"}
+            ],
+            temperature=0,
+            use_cache=args.cache
+        )
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(i) for i in range(args.calls)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    latencies.sort()
+    print(f"{args.calls} calls, {args.prompts} prompts, {len(failures)} failed, {elapsed:.2f}s")
+    if latencies:
+        for percentile in (50, 90, 99):
+            print(f"  p{percentile}: {latencies[int(len(latencies) * percentile / 100) - 1] * 1000:.0f} ms")
+    for name, value in sorted(metrics.snapshot()["counters"].items()):
+        print(f"  {name}: {value:g}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chat completions against the fake provider")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--hedge-percentile", type=float, default=0)
+    args = parser.parse_args()
+
+    configure(args)
+    asyncio.run(main(args))
@@ -0,0 +1,85 @@
+"""
+Records per second of transform node operations
+
+Generates N records and runs a map, filter, reduce and sort over them
+with each available engine. For comparison it also times evaluating the
+expression with eval() once per record, the cost of interpreting it
+record by record, and the operation written by hand as a Python loop.
+
+Usage: python -m benchmarks.transforms [--records 100000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+from app.core.config import settings
+from app.services import transform_engine
+from app.services.transform_engine import compile_transform
+
+OPERATIONS = [
+    ("map", "{\"id\": id, \"total\": price * quantity * (1 - discount)}",
+     lambda records: [{"id": r["id"], "total": r["price"] * r["quantity"] * (1 - r["discount"])} for r in records]),
+    ("filter", "price > 50 and status == \"active\"",
+     lambda records: [r for r in records if r["price"] > 50 and r["status"] == "active"]),
+    ("reduce", "sum(price * quantity) / count()",
+     lambda records: sum(r["price"] * r["quantity"] for r in records) / len(records)),
+    ("sort", "-price",
+     lambda records: sorted(records, key=lambda r: -r["price"])),
+]
+
+def make_records(count: int):
+    rng = random.Random(0)
+    return [
+        {
+            "id": i,
+            "price": round(rng.uniform(1, 100), 2),
+            "quantity": rng.randint(1, 20),
+            "discount": rng.choice((0, 0.1, 0.25)),
+            "status": rng.choice(("active", "inactive", "pending"))
+        }
+        for i in range(count)
+    ]
+
+def best_time(call, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def per_record_eval(operation: str, expression: str):
+    """Get the operation evaluating the expression once per record, None for reduce"""
+    code = compile(expression, "<expression>", "eval")
+    if operation == "map":
+        return lambda records: [eval(code, {}, record) for record in records]
+    if operation == "filter":
+        return lambda records: [record for record in records if eval(code, {}, record)]
+    if operation == "sort":
+        return lambda records: sorted(records, key=lambda record: eval(code, {}, record))
+    return None
+
+def main(count: int, repeat: int):
+    records = make_records(count)
+    engines = ["python"] + (["numpy"] if transform_engine.np is not None else [])
+
+    print(f"{count} records, best of {repeat}, records per second")
+    columns = ["hand loop", "eval/record"] + engines
+    print(f"  {'operation':10}" + "".join(f" {column:>14}" for column in columns))
+    for operation, expression, loop in OPERATIONS:
+        transform = compile_transform(operation, expression)
+        evaluate = per_record_eval(operation, expression)
+        row = [
+            count / best_time(lambda: loop(records), repeat),
+            count / best_time(lambda: evaluate(records), repeat) if evaluate else None
+        ]
+        for engine in engines:
+            settings.transform_engine = engine
+            row.append(count / best_time(lambda: transform.apply(records), repeat))
+        print(f"  {operation:10}" + "".join(f" {rate:>14,.0f}" if rate else f" {'-':>14}" for rate in row))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark transform node operations")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.records, args.repeat)